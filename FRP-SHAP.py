@@ -6,20 +6,59 @@
 #
 ################################################################################
 import sys, os
+import json
 import pandas as pd
 import numpy as np
 ################################################################################
 
 
-# python3 XXX.py -bench dt_ijar_examples.txt
+def mismatches(frp_scores, scores):
+    """
+        Rows where the SHAP score of some irrelevant feature (FRP count 0)
+        is no smaller than the SHAP score of some relevant feature.
+
+        :param frp_scores: FRP counts, one row per instance.
+        :param scores: SHAP scores, one row per instance.
+        :return: a boolean array, one entry per row.
+    """
+    irr = frp_scores == 0
+    max_irr = np.where(irr, scores, -np.inf).max(axis=1)
+    min_rel = np.where(irr, np.inf, scores).min(axis=1)
+    # rows without irrelevant features are skipped
+    return irr.any(axis=1) & (max_irr >= min_rel)
+
+
+def count_mismatches(frp_data, sc_data, s_sc_data):
+    """
+        Compare FRP with SHAP and sSHAP on one chunk of instances.
+
+        :return: a dictionary of counts.
+    """
+    frp_scores = np.round(np.abs(frp_data.to_numpy()), decimals=4)
+    sc_scores = np.round(np.abs(sc_data.to_numpy()), decimals=4)
+    s_sc_scores = np.round(np.abs(s_sc_data.to_numpy()), decimals=4)
+
+    mis_sc = mismatches(frp_scores, sc_scores)
+    mis_s_sc = mismatches(frp_scores, s_sc_scores)
+    return {'SHAP-FRP mismatch': int(mis_sc.sum()),
+            'sSHAP-FRP mismatch': int(mis_s_sc.sum()),
+            'sSHAP is better': int((mis_sc & ~mis_s_sc).sum()),
+            'sSHAP is worse': int((~mis_sc & mis_s_sc).sum())}
+
+
+# python3 XXX.py -bench dt_ijar_examples.txt [-chunk 100000] [-json results/frp_shap.json]
 if __name__ == '__main__':
     args = sys.argv[1:]
     if len(args) >= 2 and args[0] == '-bench':
         bench_name = args[1]
+        # read result files in chunks of rows (bounded memory)
+        chunksize = int(args[args.index('-chunk') + 1]) if '-chunk' in args else 100000
+        json_file = args[args.index('-json') + 1] if '-json' in args else None
 
         with open(bench_name, 'r') as fp:
             name_list = fp.readlines()
 
+        all_cnts = dict()
         for item in name_list:
             name = item.strip()
             print(f"################## {name} ##################")
@@ -27,37 +66,18 @@ if __name__ == '__main__':
             sc_file_path = os.path.join("results/sc", f"{name}.csv")
             s_sc_file_path = os.path.join("results/s_sc", f"{name}.csv")
 
-            frp_data = pd.read_csv(frp_file_path)
-            sc_data = pd.read_csv(sc_file_path)
-            s_sc_data = pd.read_csv(s_sc_file_path)
-
-            frp_scores = np.round(np.abs(frp_data.to_numpy()), decimals=4)
-            sc_scores = np.round(np.abs(sc_data.to_numpy()), decimals=4)
-            s_sc_scores = np.round(np.abs(s_sc_data.to_numpy()), decimals=4)
-
-            cnt_frp_sc = 0
-            cnt_frp_s_sc = 0
-            cnt_better = 0
-            cnt_worse = 0
-            # Iterate through each line in the scores
-            for i, (frp_line, sc_line, s_sc_line) in enumerate(zip(frp_scores, sc_scores, s_sc_scores), start=1):
-                # Check if there is no 0 in frp_score for the current line
-                if 0 not in frp_line:
-                    continue
-
-                # Split sc_line based on frp_line
-                rel_sc = [sc_val for frp_val, sc_val in zip(frp_line, sc_line) if frp_val != 0]
-                irr_sc = [sc_val for frp_val, sc_val in zip(frp_line, sc_line) if frp_val == 0]
-
-                rel_s_sc = [s_sc_val for frp_val, s_sc_val in zip(frp_line, s_sc_line) if frp_val != 0]
-                irr_s_sc = [s_sc_val for frp_val, s_sc_val in zip(frp_line, s_sc_line) if frp_val == 0]
-
-                if max(irr_sc) >= min(rel_sc):
-                    cnt_frp_sc += 1
-                if max(irr_s_sc) >= min(rel_s_sc):
-                    cnt_frp_s_sc += 1
-                if max(irr_sc) >= min(rel_sc) and max(irr_s_sc) < min(rel_s_sc):
-                    cnt_better += 1
-                if max(irr_sc) < min(rel_sc) and max(irr_s_sc) >= min(rel_s_sc):
-                    cnt_worse += 1
-            print(f"SHAP-FRP mismatch: {cnt_frp_sc}", f"sSHAP-FRP mismatch: {cnt_frp_s_sc}", f"sSHAP is better: {cnt_better}", f"sSHAP is worse: {cnt_worse}")
+            cnts = {'SHAP-FRP mismatch': 0, 'sSHAP-FRP mismatch': 0, 'sSHAP is better': 0, 'sSHAP is worse': 0}
+            with pd.read_csv(frp_file_path, chunksize=chunksize) as frp_reader, \
+                    pd.read_csv(sc_file_path, chunksize=chunksize) as sc_reader, \
+                    pd.read_csv(s_sc_file_path, chunksize=chunksize) as s_sc_reader:
+                for frp_data, sc_data, s_sc_data in zip(frp_reader, sc_reader, s_sc_reader):
+                    assert len(frp_data) == len(sc_data) == len(s_sc_data)
+                    for key, cnt in count_mismatches(frp_data, sc_data, s_sc_data).items():
+                        cnts[key] += cnt
+            all_cnts[name] = cnts
+            print(*[f"{key}: {cnt}" for key, cnt in cnts.items()])
+            print(json.dumps({name: cnts}))
+
+        if json_file:
+            with open(json_file, 'w') as fp:
+                json.dump(all_cnts, fp, indent=2)
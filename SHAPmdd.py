@@ -6,17 +6,150 @@
 #
 ################################################################################
 import math
+import time
+import functools
+from fractions import Fraction
+from statistics import NormalDist
 from itertools import chain, combinations
+import numpy as np
 from omdd import OMDD
 ################################################################################
 
 
+# in exact mode, probabilities are read as the closest fraction with a bounded denominator
+MAX_PROB_DENOMINATOR = 10 ** 9
+
+
 def powerset_generator(input):
     # Generate all subsets of the input set
     for subset in chain.from_iterable(combinations(input, r) for r in range(len(input) + 1)):
         yield set(subset)
 
 
+@functools.lru_cache(maxsize=None)
+def shapley_weights(nf):
+    """
+        Shapley weight |S|! (nf-|S|-1)! / nf! of each coalition size |S| = 0..nf-1.
+
+        :param nf: number of features.
+        :return: a tuple of fractions.
+    """
+    return tuple(Fraction(math.factorial(s) * math.factorial(nf - s - 1), math.factorial(nf))
+                 for s in range(nf))
+
+
+@functools.lru_cache(maxsize=None)
+def coalition_masks(nf, target_feat):
+    """
+        Coalitions of the features other than target_feat, in the order of algo_by_def,
+        as bit masks (bit i set if feature i is in the coalition) and sizes.
+
+        :return: two int arrays.
+    """
+    feats = [i for i in range(nf) if i != target_feat]
+    all_S = list(powerset_generator(feats))
+    return (np.array([sum(1 << i for i in S) for S in all_S], dtype=np.int64),
+            np.array([len(S) for S in all_S], dtype=np.int64))
+
+
+class CountTable(object):
+    """
+        Instance-independent counting tables of an OMDD, shared by the SHAP queries
+        of all instances on the model.
+        The number of models below a node (per target value) only depends on the node,
+        on which of the features below it are universal and on the values of the fixed ones.
+        Counts are memoized under this signature: the counts of nodes whose features below
+        are all universal are computed upfront and serve every instance and coalition,
+        and a query only visits the nodes consistent with the instance on the fixed features,
+        stopping at signatures already seen (for this or a previous instance).
+    """
+
+    def __init__(self, dd: OMDD, max_entries=10 ** 5):
+        self.dd = dd
+        # memoized counts are keyed by node ids: the table is only valid for this structure
+        # (topo_order is recomputed whenever nodes change or are renumbered)
+        self.order = dd.topo_order()
+        self.max_entries = max_entries      # the memo is reset to the upfront counts beyond this
+        self.tars = np.array(dd.tar_range)
+        tar_pos = {t: j for j, t in enumerate(dd.tar_range)}
+        # same overflow bound as SHAPoMDD._counting_batch
+        space = dd.dom_prod[-1] * (max(abs(t) for t in dd.tar_range) or 1)
+        self.dtype = np.int64 if space < 2 ** 62 else object
+        self.dom_size = tuple(dd.dom_prod[lvl + 1] // dd.dom_prod[lvl] for lvl in range(dd.nf))
+
+        def term_val(label):
+            cnt = np.zeros(len(self.tars), dtype=self.dtype)
+            cnt[tar_pos[label]] = 1
+            return cnt
+
+        def edge_val(nd, s, vals, cnt_s):
+            return cnt_s * (dd.dom_prod[dd.nd2lvl[s]] // dd.dom_prod[dd.nd2lvl[nd] + 1]) * len(vals)
+
+        # signature 0: all features below are universal
+        self.free = {(nd, 0): cnt for nd, cnt in dd.bottom_up(term_val, edge_val).items()}
+        self.memo = dict(self.free)
+
+    def count(self, inst, fixed):
+        """
+            Number of models of each target value, with the features not in fixed universal
+            (the count of SHAPoMDD.model_counting, for all target values at once).
+
+            :param inst: given instance.
+            :param fixed: a list of booleans, true for the fixed features.
+            :return: an array of counts, aligned with tar_range.
+        """
+        dd = self.dd
+        nf = dd.nf
+        # suffix[lvl] encodes the values of the fixed features at levels >= lvl
+        # (0 for universal features), prefix[lvl] as in model_counting
+        suffix = [0] * (nf + 1)
+        for lvl in range(nf - 1, -1, -1):
+            f_id = dd.lvl2fid[lvl]
+            digit = dd.val2pos[f_id][inst[f_id]] + 1 if fixed[f_id] else 0
+            suffix[lvl] = digit + (self.dom_size[lvl] + 1) * suffix[lvl + 1]
+        prefix = [1]
+        for lvl in range(nf):
+            prefix.append(prefix[-1] * (1 if fixed[dd.lvl2fid[lvl]] else self.dom_size[lvl]))
+        if len(self.memo) > self.max_entries:
+            self.memo = dict(self.free)
+        memo = self.memo
+
+        def visit(nd):
+            lvl = dd.nd2lvl[nd]
+            key = (nd, suffix[lvl])
+            cnt = memo.get(key)
+            if cnt is None:
+                f_id = dd.nd2fid[nd]
+                if fixed[f_id]:
+                    s = dd.nd2chd[nd][inst[f_id]]
+                    cnt = visit(s) * (prefix[dd.nd2lvl[s]] // prefix[lvl + 1])
+                else:
+                    cnt = 0
+                    for s, vals in dd.children(nd):
+                        cnt = cnt + visit(s) * (prefix[dd.nd2lvl[s]] // prefix[lvl + 1]) * len(vals)
+                memo[key] = cnt
+            return cnt
+
+        # the root may be below level 0 (e.g. after an update), multiply in the levels above it
+        return visit(dd.root) * prefix[dd.nd2lvl[dd.root]]
+
+
+class SHAPEstimate(object):
+    """
+        Result of SHAPoMDD.sample_shap.
+    """
+
+    def __init__(self, scores, half_widths, n_samples, settled, runtime):
+        self.scores = scores                # estimated SHAP score of each feature
+        self.half_widths = half_widths      # half-width of the confidence interval of each score
+        self.n_samples = n_samples          # number of sampled permutations
+        self.settled = settled              # true if the ranking of features is statistically settled
+        self.runtime = runtime
+
+    def intervals(self):
+        return [(sc - hw, sc + hw) for sc, hw in zip(self.scores, self.half_widths)]
+
+
 class SHAPoMDD(object):
     """
         Compute SHAP-score of OMDD, note that OMDD support polytime model counting.
@@ -25,6 +158,7 @@ class SHAPoMDD(object):
     def __init__(self, dd: OMDD, verb=0):
         self.dd = dd
         self.verbose = verb
+        self._table = None                  # CountTable (see precompute)
 
     def model_counting(self, inst, tar, univ):
         """
@@ -37,60 +171,117 @@ class SHAPoMDD(object):
         """
 
         assert len(univ) == self.dd.nf
-        assign = dict()
-        G = self.dd.graph
-        for nd in self.dd.dfs_postorder(self.dd.root):
-            if not G.out_degree(nd):
-                if G.nodes[nd]['target'] == tar:
-                    assign.update({nd: 1})
-                else:
-                    assign.update({nd: 0})
-        for nd in self.dd.dfs_postorder(self.dd.root):
-            if not G.out_degree(nd):
-                continue
-            feat_nd = G.nodes[nd]['var']
-            f_id_nd = self.dd.features.index(feat_nd)
-            feat_lvl_nd = self.dd.feat2lvl[feat_nd]
-            total = 0
+        dd = self.dd
+        # prefix[lvl] is the product, over the levels above lvl, of the domain size
+        # if the feature is universal and 1 otherwise
+        prefix = [1]
+        for lvl in range(dd.nf):
+            ratio = dd.dom_prod[lvl + 1] // dd.dom_prod[lvl]
+            prefix.append(prefix[-1] * (ratio if univ[dd.lvl2fid[lvl]] else 1))
+
+        def edge_val(nd, s, vals, cnt_s):
+            f_id_nd = dd.nd2fid[nd]
             if univ[f_id_nd]:
-                for s in G.successors(nd):
-                    assert s in assign
-                    if G.out_degree(s):
-                        feat_s = G.nodes[s]['var']
-                        feat_lvl_s = self.dd.feat2lvl[feat_s]
-                    else:
-                        feat_lvl_s = self.dd.nf
-                    assert feat_lvl_nd < feat_lvl_s
-                    prod = 1
-                    for lvl_i in range(feat_lvl_nd+1, feat_lvl_s):
-                        f_i = self.dd.features.index(self.dd.lvl2feat[lvl_i])
-                        if univ[f_i]:
-                            prod *= len(self.dd.feat_domain[self.dd.lvl2feat[lvl_i]])
-                    # multi-edges between nd and s
-                    total += assign[s] * prod * G.number_of_edges(nd, s)
+                # multi-edges between nd and s
+                n_egs = len(vals)
             else:
-                for s in G.successors(nd):
-                    assert s in assign
-                    # multi-edges case is not appliable
-                    if tuple((nd, s, inst[f_id_nd])) in G.edges:
-                        if G.out_degree(s):
-                            feat_s = G.nodes[s]['var']
-                            feat_lvl_s = self.dd.feat2lvl[feat_s]
-                        else:
-                            feat_lvl_s = self.dd.nf
-                        assert feat_lvl_nd < feat_lvl_s
-                        prod = 1
-                        for lvl_i in range(feat_lvl_nd+1, feat_lvl_s):
-                            f_i = self.dd.features.index(self.dd.lvl2feat[lvl_i])
-                            if univ[f_i]:
-                                prod *= len(self.dd.feat_domain[self.dd.lvl2feat[lvl_i]])
-                        total += assign[s] * prod
-            assert nd not in assign
-            assign.update({nd: total})
-        assert self.dd.root in assign
-        n_model = assign[self.dd.root]
+                # multi-edges case is not appliable
+                n_egs = int(dd.nd2chd[nd][inst[f_id_nd]] == s)
+            if not n_egs:
+                return 0
+            feat_lvl_nd = dd.nd2lvl[nd]
+            feat_lvl_s = dd.nd2lvl[s]
+            assert feat_lvl_nd < feat_lvl_s
+            # multiplier of the levels skipped by this edge
+            return cnt_s * (prefix[feat_lvl_s] // prefix[feat_lvl_nd + 1]) * n_egs
+
+        assign = dd.bottom_up(lambda label: int(label == tar), edge_val)
+        assert dd.root in assign
+        # levels above the root (below level 0 after an update, or a terminal)
+        n_model = assign[dd.root] * prefix[dd.nd2lvl[dd.root]]
         return n_model
 
+    def model_counting_batch(self, inst, tar, univs):
+        """
+            Batch version of model_counting:
+            count the number of models for many lists of universal features (coalitions)
+            in a single bottom-up pass, with one array of k counts per node.
+
+            :param inst: given instance.
+            :param tar: target value.
+            :param univs: a 2-D boolean array of shape (k, nf),
+                        each row is a list of universal features.
+            :return: an array of k numbers of models.
+        """
+        return self._counting_batch(inst, univs, lambda label: int(label == tar))
+
+    def _counting_batch(self, inst, univs, label_weight):
+        """
+            Weighted model counting for k lists of universal features at once,
+            each model reaching a terminal labelled t contributes label_weight(t).
+
+            :param inst: given instance.
+            :param univs: a 2-D boolean array of shape (k, nf).
+            :param label_weight: function mapping a target value to an integer weight.
+            :return: an array of k weighted counts.
+        """
+
+        dd = self.dd
+        univs = np.asarray(univs, dtype=bool)
+        assert univs.ndim == 2 and univs.shape[1] == dd.nf
+        k = univs.shape[0]
+        # counts are bounded by the size of the input space (times the largest weight),
+        # fall back to python integers if int64 may overflow
+        space = dd.dom_prod[-1]
+        space *= max(abs(label_weight(t)) for t in dd.tar_range) or 1
+        dtype = np.int64 if space < 2 ** 62 else object
+
+        # prefix[lvl] is the product, over the levels above lvl, of the domain size
+        # if the feature is universal and 1 otherwise (vectorized over the k coalitions),
+        # thus the multiplier for the levels skipped by an edge from level a to level b
+        # is prefix[b] // prefix[a+1].
+        prefix = np.ones((dd.nf + 1, k), dtype=dtype)
+        for lvl in range(dd.nf):
+            ratio = dd.dom_prod[lvl + 1] // dd.dom_prod[lvl]
+            prefix[lvl + 1] = prefix[lvl] * np.where(univs[:, dd.lvl2fid[lvl]], ratio, 1)
+
+        def edge_val(nd, s, vals, cnt_s):
+            f_id_nd = dd.nd2fid[nd]
+            # multi-edges between nd and s if universal, else at most one edge
+            n_egs = np.where(univs[:, f_id_nd], len(vals), int(dd.nd2chd[nd][inst[f_id_nd]] == s))
+            feat_lvl_nd = dd.nd2lvl[nd]
+            feat_lvl_s = dd.nd2lvl[s]
+            assert feat_lvl_nd < feat_lvl_s
+            return cnt_s * (prefix[feat_lvl_s] // prefix[feat_lvl_nd + 1]) * n_egs
+
+        assign = dd.bottom_up(lambda label: np.full(k, label_weight(label), dtype=dtype), edge_val)
+        # levels above the root (below level 0 after an update, or a terminal)
+        return assign[dd.root] * prefix[dd.nd2lvl[dd.root]]
+
+    def _univ_weights(self, inst, univs):
+        """
+            Product of the probabilities of the instance values
+            of the universal features, for each row of univs.
+        """
+        probs = self.dd.value_probs(inst)
+        return np.where(np.asarray(univs, dtype=bool), np.array(probs), 1.0).prod(axis=1)
+
+    def expect_value_batch(self, inst, univs):
+        """
+            Batch version of expect_value, for a 2-D boolean array of shape (k, nf).
+            The label-weighted counts of all target values are obtained in one pass.
+        """
+        cnts = self._counting_batch(inst, univs, lambda label: label)
+        return cnts.astype(float) * self._univ_weights(inst, univs)
+
+    def similarity_func_batch(self, inst, univs):
+        """
+            Batch version of similarity_func, for a 2-D boolean array of shape (k, nf).
+        """
+        pred = self.dd.predict_one(inst)
+        cnts = self.model_counting_batch(inst, pred, univs)
+        return cnts.astype(float) * self._univ_weights(inst, univs)
+
     def expect_value(self, inst, univ):
         """
             Compute the expectation value of the given instance.
@@ -100,10 +291,9 @@ class SHAPoMDD(object):
             cnt = self.model_counting(inst, i, univ)
             label_cnt.update({i: cnt})
         expect_val = sum(i * label_cnt[i] for i in label_cnt)
-        for i in range(self.dd.nf):
-            feat = self.dd.features[i]
+        for i, prob in enumerate(self.dd.value_probs(inst)):
             if univ[i]:
-                expect_val *= self.dd.fv_probs[feat][self.dd.feat_domain[feat].index(inst[i])]
+                expect_val *= prob
         return expect_val
 
     def similarity_func(self, inst, univ):
@@ -112,51 +302,217 @@ class SHAPoMDD(object):
         """
         pred = self.dd.predict_one(inst)
         cnt = self.model_counting(inst, pred, univ)
-        for i in range(self.dd.nf):
-            feat = self.dd.features[i]
+        for i, prob in enumerate(self.dd.value_probs(inst)):
             if univ[i]:
-                cnt *= self.dd.fv_probs[feat][self.dd.feat_domain[feat].index(inst[i])]
+                cnt *= prob
         return cnt
 
-    def algo_by_def(self, inst, target_feat, vtype='expected'):
+    def _value_batch(self, vtype):
+        if vtype == 'expected':
+            return self.expect_value_batch
+        elif vtype == 'similarity':
+            return self.similarity_func_batch
+        else:
+            raise ValueError("Unknown value function.")
+
+    def _exact_value_batch(self, vtype, inst, univs):
+        """
+            Exact (rational) version of the batch value functions.
+        """
+        if vtype == 'expected':
+            cnts = self._counting_batch(inst, univs, lambda label: label)
+        elif vtype == 'similarity':
+            cnts = self.model_counting_batch(inst, self.dd.predict_one(inst), univs)
+        else:
+            raise ValueError("Unknown value function.")
+        probs = [Fraction(prob).limit_denominator(MAX_PROB_DENOMINATOR) for prob in self.dd.value_probs(inst)]
+        return [int(cnt) * math.prod((p for p, u in zip(probs, univ) if u), start=Fraction(1))
+                for cnt, univ in zip(cnts, univs)]
+
+    def algo_by_def(self, inst, target_feat, vtype='expected', numerics='float'):
         """
             Computing SHAP-score by definition (using model counting).
         :param inst: given instance
         :param target_feat: given feature
         :param vtype: value function type
+        :param numerics: 'float' (float64, fast path) or 'exact' (fractions)
         :return: the SHAP-score of the target feature on given instance
         with respect to given OMDD under uniform distribution
+        (a float, or a Fraction in exact mode)
         """
+        if numerics == 'float':
+            value_batch = self._value_batch(vtype)
+        elif numerics == 'exact':
+            value_batch = functools.partial(self._exact_value_batch, vtype)
+        else:
+            raise ValueError("Unknown numerics.")
+
         nf = self.dd.nf
         feats = list(range(nf))
         assert target_feat in feats
         feats.remove(target_feat)
         all_S = list(powerset_generator(feats))
-        shap_score = 0
-        for S in all_S:
-            len_S = len(list(S))
-            univ = [False] * nf
-            for i in range(nf):
-                if i not in list(S):
-                    univ[i] = True
-
-            univ[target_feat] = False
-            if vtype == 'expected':
-                mds_with_t = self.expect_value(inst, univ)
-            elif vtype == 'similarity':
-                mds_with_t = self.similarity_func(inst, univ)
-            else:
-                raise ValueError("Unknown value function.")
+        sizes = [len(S) for S in all_S]
+        # one row per coalition S, features not in S are universal
+        univs = np.ones((len(all_S), nf), dtype=bool)
+        for j, S in enumerate(all_S):
+            univs[j, list(S)] = False
+        univs[:, target_feat] = False
+        mds_with_t = value_batch(inst, univs)
+        univs[:, target_feat] = True
+        mds_without_t = value_batch(inst, univs)
+
+        weights = shapley_weights(nf)
+        if numerics == 'float':
+            weights = np.array([float(w) for w in weights])
+            return float(np.dot(weights[sizes], mds_with_t - mds_without_t))
+        return sum((weights[s] * (with_t - without_t)
+                    for s, with_t, without_t in zip(sizes, mds_with_t, mds_without_t)), Fraction(0))
+
+    def numerics_deviation(self, inst, vtype='expected'):
+        """
+            Maximum deviation between the float and the exact SHAP scores
+            of all features on the given instance.
+        """
+        return max(float(abs(Fraction(self.algo_by_def(inst, i, vtype)) - self.algo_by_def(inst, i, vtype, 'exact')))
+                   for i in range(self.dd.nf))
 
-            univ[target_feat] = True
-            if vtype == 'expected':
-                mds_without_t = self.expect_value(inst, univ)
-            elif vtype == 'similarity':
-                mds_without_t = self.similarity_func(inst, univ)
+    def precompute(self, max_entries=10 ** 5):
+        """
+            Build the instance-independent counting tables of the model (a CountTable),
+            used by coalition_values and shap_scores. They do not depend on the
+            feature-value probabilities, and are rebuilt only if the diagram changes
+            (updates, or nodes renumbered by compact).
+
+        :param max_entries: bound on the number of memoized node counts
+        :return: the CountTable
+        """
+        dd = self.dd
+        if (self._table is None or self._table.order is not dd.topo_order()
+                or self._table.max_entries != max_entries):
+            self._table = CountTable(dd, max_entries)
+        return self._table
+
+    def coalition_values(self, inst, vtype='expected', numerics='float'):
+        """
+            Values of all the coalitions of features on the given instance,
+            from the precomputed tables (see precompute).
+
+        :param inst: given instance
+        :param vtype: value function type
+        :param numerics: 'float' or 'exact' (fractions)
+        :return: the values indexed by coalition mask (bit i set if feature i is fixed),
+                an array of floats, or a list of fractions in exact mode
+        """
+        if vtype not in ('expected', 'similarity'):
+            raise ValueError("Unknown value function.")
+        if numerics not in ('float', 'exact'):
+            raise ValueError("Unknown numerics.")
+        table = self.precompute()
+        nf = self.dd.nf
+        masks = np.arange(2 ** nf)
+        univs = (masks[:, None] >> np.arange(nf)[None, :]) & 1 == 0
+        if vtype == 'expected':
+            cnts = [int(np.dot(table.tars, table.count(inst, ~univ))) for univ in univs]
+        else:
+            pos = self.dd.tar_range.index(self.dd.predict_one(inst))
+            cnts = [int(table.count(inst, ~univ)[pos]) for univ in univs]
+        if numerics == 'float':
+            return np.array(cnts, dtype=table.dtype).astype(float) * self._univ_weights(inst, univs)
+        probs = [Fraction(prob).limit_denominator(MAX_PROB_DENOMINATOR) for prob in self.dd.value_probs(inst)]
+        return [cnt * math.prod((p for p, u in zip(probs, univ) if u), start=Fraction(1))
+                for cnt, univ in zip(cnts, univs)]
+
+    def shap_scores(self, inst, vtype='expected', numerics='float'):
+        """
+            SHAP scores of all features on the given instance, same as
+            [algo_by_def(inst, i, vtype, numerics) for each feature i],
+            each coalition value is computed once from the precomputed tables.
+        """
+        values = self.coalition_values(inst, vtype, numerics)
+        nf = self.dd.nf
+        weights = shapley_weights(nf)
+        if numerics == 'float':
+            weights = np.array([float(w) for w in weights])
+        scores = []
+        for t in range(nf):
+            masks, sizes = coalition_masks(nf, t)
+            if numerics == 'float':
+                scores.append(float(np.dot(weights[sizes], values[masks | (1 << t)] - values[masks])))
             else:
-                raise ValueError("Unknown value function.")
+                scores.append(sum((weights[s] * (values[m | (1 << t)] - values[m])
+                                   for m, s in zip(masks.tolist(), sizes.tolist())), Fraction(0)))
+        return scores
+
+    def sample_shap(self, inst, vtype='expected', max_samples=1000, time_budget=None,
+                    confidence=0.95, tol=0.0, min_samples=30, batch=32, seed=None):
+        """
+            Anytime estimation of the SHAP scores of all features by permutation sampling,
+            using exact (batch) model counting as value oracle.
+            Each sampled permutation gives one marginal contribution per feature,
+            the nf+1 coalitions of a batch of permutations are evaluated in one pass.
+            Sampling stops when max_samples or time_budget is reached, when all
+            confidence intervals are narrower than tol, or when the ranking of features
+            (by absolute score) is settled, i.e. consecutive intervals do not overlap
+            (or are both narrower than tol, the features are then tied).
 
-            if mds_with_t - mds_without_t == 0:
+        :param inst: given instance
+        :param vtype: value function type
+        :param max_samples: maximum number of permutations
+        :param time_budget: maximum runtime in seconds (None for no limit)
+        :param confidence: confidence level of the intervals
+        :param tol: stop when all half-widths are at most tol
+        :param min_samples: number of permutations before testing the stopping criteria
+        :param batch: number of permutations evaluated at once
+        :param seed: random seed
+        :return: a SHAPEstimate
+        """
+        time_solving_start = time.perf_counter()
+        value_batch = self._value_batch(vtype)
+        nf = self.dd.nf
+        rng = np.random.default_rng(seed)
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        sums = np.zeros(nf)
+        sqsums = np.zeros(nf)
+        n = 0
+        half_widths = np.full(nf, np.inf)
+        settled = False
+
+        while n < max_samples:
+            k = min(batch, max_samples - n)
+            # pos[b, f] is the position of feature f in the b-th permutation,
+            # the j-th coalition of a permutation fixes the features at positions < j
+            pos = np.argsort(rng.random((k, nf)), axis=1)
+            univs = pos[:, None, :] >= np.arange(nf + 1)[None, :, None]
+            values = value_batch(inst, univs.reshape(-1, nf)).reshape(k, nf + 1)
+            contribs = np.take_along_axis(np.diff(values, axis=1), pos, axis=1)
+            sums += contribs.sum(axis=0)
+            sqsums += (contribs ** 2).sum(axis=0)
+            n += k
+
+            means = sums / n
+            if n > 1:
+                var = np.maximum(sqsums - n * means ** 2, 0) / (n - 1)
+                half_widths = z * np.sqrt(var / n)
+            if time_budget is not None and time.perf_counter() - time_solving_start >= time_budget:
+                break
+            if n < min_samples:
                 continue
-            shap_score += math.factorial(len_S) * math.factorial(nf-len_S-1) * (mds_with_t - mds_without_t) / math.factorial(nf)
-        return shap_score
+            if np.all(half_widths <= tol):
+                break
+            order = np.argsort(-np.abs(means))
+            lo = np.abs(means[order]) - half_widths[order]
+            hi = np.abs(means[order]) + half_widths[order]
+            # consecutive features are ordered if their intervals are disjoint,
+            # and tied if both intervals are narrower than tol (e.g. equal, zero-width)
+            tied = (half_widths[order][:-1] <= tol) & (half_widths[order][1:] <= tol)
+            if np.all((lo[:-1] > hi[1:]) | tied):
+                settled = True
+                break
+
+        time_solving_end = time.perf_counter()
+        runtime = time_solving_end - time_solving_start
+        if self.verbose:
+            print(f"#samples: {n}, settled: {settled}")
+            print("Runtime: {0:.3f}".format(runtime))
+        return SHAPEstimate(list(sums / n), list(half_widths), n, settled, runtime)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#
+#   Deletion strategies of find_axp / find_cxp on the benchmark set
+#   (oracle calls and runtime)
+#
+################################################################################
+import sys
+import time
+from omdd import OMDD
+from xpmdd import XpOMDD, order_by_scores
+################################################################################
+
+# (order, strategy), 'shap' orders by the SHAP scores of the instance
+STRATEGIES = [('index', 'linear'), ('level', 'linear'), ('shap', 'linear'),
+              ('index', 'quickxplain'), ('level', 'quickxplain'), ('shap', 'quickxplain')]
+
+
+def bench(mdd_model: OMDD, Xs, strategies=STRATEGIES):
+    """
+        Compute one AXp and one CXp of each instance with each strategy.
+
+        :return: a dictionary (order, strategy) -> {'axp'/'cxp': [calls, time, total size]}.
+    """
+    from SHAPmdd import SHAPoMDD
+    shap_dd = SHAPoMDD(mdd_model)
+    ret = {s: {'axp': [0, 0.0, 0], 'cxp': [0, 0.0, 0]} for s in strategies}
+    for x in Xs:
+        pred = mdd_model.predict_one(x)
+        xpmdd = XpOMDD(mdd_model, x, pred)
+        shap_order = None
+        for order, strategy in strategies:
+            if order == 'shap' and shap_order is None:
+                shap_order = order_by_scores(shap_dd.shap_scores(x, 'expected'))
+            for xtype in ('axp', 'cxp'):
+                find = xpmdd.find_axp if xtype == 'axp' else xpmdd.find_cxp
+                expl = find(None, shap_order if order == 'shap' else order, strategy)
+                stats = ret[(order, strategy)][xtype]
+                stats[0] += xpmdd.stats['calls']
+                stats[1] += xpmdd.stats['time']
+                stats[2] += len(expl)
+    return ret
+
+
+# python3 benchDeletion.py [-models dt_ijar_examples.txt]
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    models_file = args[args.index('-models') + 1] if '-models' in args else 'dt_ijar_examples.txt'
+    with open(models_file, 'r') as fp:
+        names = [line.strip() for line in fp if line.strip()]
+
+    totals = {s: {'axp': [0, 0.0, 0], 'cxp': [0, 0.0, 0]} for s in STRATEGIES}
+    n_insts = 0
+    start = time.perf_counter()
+    for name in names:
+        mdd_model = OMDD.from_file(f"dt_models/{name}.mdd")
+        mdd_model.set_fv_probs_uniform()
+        Xs = mdd_model.read_samples(f"samples/{name}.csv").tolist()
+        n_insts += len(Xs)
+        for s, res in bench(mdd_model, Xs).items():
+            for xtype in ('axp', 'cxp'):
+                totals[s][xtype] = [a + b for a, b in zip(totals[s][xtype], res[xtype])]
+
+    print(f"{len(names)} models, {n_insts} instances ({time.perf_counter() - start:.1f}s)")
+    for (order, strategy), res in totals.items():
+        line = f"{order:>6} {strategy:>12}:"
+        for xtype in ('axp', 'cxp'):
+            calls, runtime, size = res[xtype]
+            line += (f"  {xtype} calls {calls / n_insts:6.2f} time {1000 * runtime / n_insts:7.3f}ms"
+                     f" size {size / n_insts:5.2f}")
+        print(line)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#
+#   Import-time benchmark (startup budget of the OMDD modules)
+#
+################################################################################
+import os
+import sys
+import subprocess
+################################################################################
+
+# import-time budget (in seconds) of each entry point
+BUDGET = {
+    'omdd': 0.1,
+    'xpmdd': 0.1,
+    'SHAPmdd': 0.3,
+    'explain': 0.1,
+}
+# these must never be loaded by the lean entry points
+HEAVY = ['sklearn', 'pandas', 'shap']
+LEAN = ['omdd', 'xpmdd', 'explain']
+
+# only the import is timed; the explain entry point then also loads a model and
+# explains an instance (not timed), to check that no heavy module is loaded on the way
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {mod}
+print(time.perf_counter() - start)
+if {mod!r} == 'explain':
+    from omdd import OMDD
+    from xpmdd import XpOMDD
+    dd = OMDD.from_file('dt_models/ijar23cs02a.mdd')
+    XpOMDD.explain_batch(dd, [[0] * dd.nf], 'both')
+print(','.join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def measure(mod, repeat=5):
+    """
+        Import a module in fresh interpreters.
+
+        :return: the best time over repeat runs, heavy modules loaded.
+    """
+    best = None
+    loaded = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', PROBE.format(mod=mod, heavy=HEAVY)],
+                             capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split('\n')
+        best = float(out[0]) if best is None else min(best, float(out[0]))
+        loaded = [m for m in out[1].split(',') if m]
+    return best, loaded
+
+
+# python3 benchImport.py
+if __name__ == '__main__':
+    ok = True
+    for mod, budget in BUDGET.items():
+        elapsed, loaded = measure(mod)
+        status = 'ok' if elapsed <= budget else 'OVER BUDGET'
+        if mod in LEAN and loaded:
+            status = f"loads {loaded}"
+        ok = ok and status == 'ok'
+        print(f"{mod}: {elapsed:.3f}s (budget {budget:.3f}s) {status}")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#
+#   Check model counting against brute force on updated OMDDs
+#   (constant diagrams, roots below level 0)
+#
+################################################################################
+import sys
+import itertools
+from omdd import OMDD
+from SHAPmdd import SHAPoMDD
+################################################################################
+
+
+def updated_models(path):
+    """
+        Updates of a model that move its root: to one of its children (root below level 0)
+        and to a terminal (constant function).
+
+        :return: a generator of (description, OMDD) pairs.
+    """
+    dd = OMDD.from_file(path)
+    for chd, vals in dd.children(dd.root):
+        upd = OMDD.from_file(path)
+        upd.replace_subfunction(upd.root, chd)
+        yield f"root -> {chd}", upd
+    for tar in dd.tar_range:
+        upd = OMDD.from_file(path)
+        upd.replace_subfunction(upd.root, upd.make_terminal(tar))
+        yield f"constant {tar}", upd
+
+
+def check(dd: OMDD):
+    """
+        Compare model_counting, model_counting_batch and the precomputed tables
+        with brute-force counts, for every instance, coalition and target value.
+
+        :return: the number of mismatches.
+    """
+    shap_dd = SHAPoMDD(dd)
+    table = shap_dd.precompute()
+    space = list(itertools.product(*[dd.feat_domain[feat] for feat in dd.features]))
+    preds = {x: dd.predict_one(list(x)) for x in space}
+    univs = [list(univ) for univ in itertools.product([False, True], repeat=dd.nf)]
+    errors = 0
+    for x in space:
+        inst = list(x)
+        for tar in dd.tar_range:
+            batch = shap_dd.model_counting_batch(inst, tar, univs)
+            for univ, cnt_batch in zip(univs, batch):
+                cnt = sum(preds[z] == tar for z in space
+                          if all(univ[i] or z[i] == x[i] for i in range(dd.nf)))
+                cnt_table = table.count(inst, [not u for u in univ])[dd.tar_range.index(tar)]
+                if not cnt == shap_dd.model_counting(inst, tar, univ) == cnt_batch == cnt_table:
+                    errors += 1
+    return errors
+
+
+# python3 checkCounting.py [-models dt_ijar_examples.txt]
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    models_file = args[args.index('-models') + 1] if '-models' in args else 'dt_ijar_examples.txt'
+    with open(models_file, 'r') as fp:
+        names = [line.strip() for line in fp if line.strip()]
+
+    ok = True
+    for name in names:
+        for desc, dd in updated_models(f"dt_models/{name}.mdd"):
+            errors = check(dd)
+            ok = ok and not errors
+            print(f"{name} ({desc}, root at level {dd.nd2lvl[dd.root]}): "
+                  f"{'ok' if not errors else f'{errors} wrong counts'}")
+    sys.exit(0 if ok else 1)
@@ -6,19 +6,26 @@
 ################################################################################
 import sys
 import pickle
-import numpy as np
 import pandas as pd
 from omdd import OMDD
 from xpmdd import XpOMDD
+from result_cache import ResultCache
+from result_writer import ResultWriter
+from instrument import ExperimentHooks
 ################################################################################
 
 
 if __name__ == '__main__':
     args = sys.argv[1:]
-    # example: python3 XXX.py -bench dt_ijar_examples.txt model (dt, rf)
+    # example: python3 XXX.py -bench dt_ijar_examples.txt model (dt, rf) [-cache results/cache.sqlite] [-resume] [-flush 10]
+    #          [-stats stats.json] [-profile cprofile|pyinstrument out.prof]
     if len(args) >= 3 and args[0] == '-bench':
         bench_name = args[1]
         md = args[2]
+        cache = ResultCache(args[args.index('-cache') + 1]) if '-cache' in args else None
+        resume = '-resume' in args
+        flush_every = int(args[args.index('-flush') + 1]) if '-flush' in args else 1
+        hooks = ExperimentHooks(args)
 
         with open(bench_name, 'r') as fp:
             name_list = fp.readlines()
@@ -35,31 +42,36 @@ if __name__ == '__main__':
                 df = pd.read_csv(data)
                 features = list(df.columns)
                 target = features.pop()
-                Xs = df[features].values.astype(int)
                 mdd_model = OMDD.from_file(mdd_file)
+                Xs = mdd_model.as_matrix(df)
                 nn = len(mdd_model.graph.nodes)
                 nf = mdd_model.nf
                 assert mdd_model.features == features
                 assert mdd_model.target == target
 
-                all_feat_cnts = []
+                writer = ResultWriter(f"results/frp/{name}.csv", features, "%d", resume, flush_every)
                 d_len = len(Xs)
                 for i, x in enumerate(Xs):
+                    if i < writer.n_done:
+                        continue
                     print(f"{name}, {i}-th instance out of {d_len}")
                     pred = mdd_model.predict_one(x)
                     inst = list(x)
                     assert len(inst) == nf
                     print(f"Instance: {x, pred}")
 
-                    xpmdd = XpOMDD(dd=mdd_model, inst=inst, tar=pred, verb=0)
-                    # relevancy/irrelevancy counter
-                    feat_cnts = nf * [0]
-                    axps, cxps = xpmdd.enum()
-                    for axp in axps:
-                        for feat in axp:
-                            feat_cnts[feat] += 1
-                    all_feat_cnts.append(feat_cnts)
+                    feat_cnts = cache.get(mdd_model.content_hash(), 'frp', inst) if cache else None
+                    if feat_cnts is None:
+                        xpmdd = XpOMDD(dd=mdd_model, inst=inst, tar=pred, verb=0)
+                        # relevancy/irrelevancy counter
+                        feat_cnts = nf * [0]
+                        axps, cxps = xpmdd.enum()
+                        for axp in axps:
+                            for feat in axp:
+                                feat_cnts[feat] += 1
+                        if cache:
+                            cache.put(mdd_model.content_hash(), 'frp', inst, feat_cnts)
+                    writer.write(feat_cnts)
+                writer.close()
 
-                header_line = ",".join(features)
-                header_line = header_line.lstrip("#")
-                np.savetxt(f"results/frp/{name}.csv", np.array(all_feat_cnts), delimiter=",", header=header_line, comments="", fmt='%d')
+        hooks.finish()
@@ -7,11 +7,15 @@
 ################################################################################
 import sys
 import pickle
+import hashlib
 import pandas as pd
 import numpy as np
 import shap
 from omdd import OMDD
 from value_functions import valueFunctions
+from result_cache import ResultCache
+from result_writer import ResultWriter
+from instrument import ExperimentHooks
 
 np.random.seed(73)
 ################################################################################
@@ -19,10 +23,15 @@ np.random.seed(73)
 
 if __name__ == '__main__':
     args = sys.argv[1:]
-    # example: python3 XXX.py -bench dt_ijar_examples.txt model (dt, rf)
+    # example: python3 XXX.py -bench dt_ijar_examples.txt model (dt, rf) [-cache results/cache.sqlite] [-resume] [-flush 10]
+    #          [-stats stats.json] [-profile cprofile|pyinstrument out.prof]
     if len(args) >= 3 and args[0] == '-bench':
         bench_name = args[1]
         md = args[2]
+        cache = ResultCache(args[args.index('-cache') + 1]) if '-cache' in args else None
+        resume = '-resume' in args
+        flush_every = int(args[args.index('-flush') + 1]) if '-flush' in args else 1
+        hooks = ExperimentHooks(args)
 
         with open(bench_name, 'r') as fp:
             datasets = fp.readlines()
@@ -39,23 +48,30 @@ if __name__ == '__main__':
                 df = pd.read_csv(data)
                 features = list(df.columns)
                 target = features.pop()
-                Xs = df[features].values.astype(int)
                 mdd_model = OMDD.from_file(mdd_file)
+                Xs = mdd_model.as_matrix(df)
                 nn = len(mdd_model.graph.nodes)
                 nf = mdd_model.nf
                 assert mdd_model.features == features
                 assert mdd_model.target == target
 
-                all_scores = []
+                # scores also depend on the background data
+                params = f"similarity;seed=73;data={hashlib.sha256(Xs.tobytes()).hexdigest()}"
+                writer = ResultWriter(f"results/s_sc/{name}.csv", features, "%.3f", resume, flush_every)
                 d_len = len(Xs)
                 for i, x in enumerate(Xs):
+                    if i < writer.n_done:
+                        continue
                     print(f"{name}, {i}-th instance out of {d_len}")
-                    valFunc = valueFunctions(mdd_model, mdd_model.predict_one(list(x)))
-                    explainer_s = shap.KernelExplainer(model=valFunc.valSimilarity, data=Xs, feature_names=features)
-                    # The values in the i-th column represent the Shapley values of the corresponding i-th feature.
-                    s_sc = explainer_s.shap_values(x)
-                    all_scores.append(s_sc)
-
-                header_line = ",".join(features)
-                header_line = header_line.lstrip("#")
-                np.savetxt(f"results/s_sc/{name}.csv", np.array(all_scores), delimiter=",", header=header_line, comments="", fmt=f"%.3f")
+                    s_sc = cache.get(mdd_model.content_hash(), 's_sc', x, params) if cache else None
+                    if s_sc is None:
+                        valFunc = valueFunctions(mdd_model, mdd_model.predict_one(list(x)))
+                        explainer_s = shap.KernelExplainer(model=valFunc.valSimilarity, data=Xs, feature_names=features)
+                        # The values in the i-th column represent the Shapley values of the corresponding i-th feature.
+                        s_sc = explainer_s.shap_values(x)
+                        if cache:
+                            cache.put(mdd_model.content_hash(), 's_sc', x, [float(v) for v in s_sc], params)
+                    writer.write(s_sc)
+                writer.close()
+
+        hooks.finish()
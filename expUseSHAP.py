@@ -7,10 +7,14 @@
 ################################################################################
 import sys
 import pickle
+import hashlib
 import pandas as pd
 import numpy as np
 import shap
 from omdd import OMDD
+from result_cache import ResultCache
+from result_writer import ResultWriter
+from instrument import ExperimentHooks
 
 np.random.seed(73)
 ################################################################################
@@ -18,10 +22,15 @@ np.random.seed(73)
 
 if __name__ == '__main__':
     args = sys.argv[1:]
-    # example: python3 XXX.py -bench dt_ijar_examples.txt model (dt, rf)
+    # example: python3 XXX.py -bench dt_ijar_examples.txt model (dt, rf) [-cache results/cache.sqlite] [-resume] [-flush 10]
+    #          [-stats stats.json] [-profile cprofile|pyinstrument out.prof]
     if len(args) >= 3 and args[0] == '-bench':
         bench_name = args[1]
         md = args[2]
+        cache = ResultCache(args[args.index('-cache') + 1]) if '-cache' in args else None
+        resume = '-resume' in args
+        flush_every = int(args[args.index('-flush') + 1]) if '-flush' in args else 1
+        hooks = ExperimentHooks(args)
 
         with open(bench_name, 'r') as fp:
             datasets = fp.readlines()
@@ -38,15 +47,23 @@ if __name__ == '__main__':
                 df = pd.read_csv(data)
                 features = list(df.columns)
                 target = features.pop()
-                Xs = df[features].values.astype(int)
                 mdd_model = OMDD.from_file(mdd_file)
+                Xs = mdd_model.as_matrix(df)
                 nn = len(mdd_model.graph.nodes)
                 nf = mdd_model.nf
                 assert mdd_model.features == features
                 assert mdd_model.target == target
 
                 explainer = shap.KernelExplainer(model=mdd_model.predict, data=Xs, feature_names=features)
-                sc = explainer.shap_values(Xs)
-                header_line = ",".join(features)
-                header_line = header_line.lstrip("#")
-                np.savetxt(f"results/sc/{name}.csv", sc, delimiter=",", header=header_line, comments="", fmt=f"%.3f")
+                # scores also depend on the background data
+                params = f"predict;seed=73;data={hashlib.sha256(Xs.tobytes()).hexdigest()}"
+                with ResultWriter(f"results/sc/{name}.csv", features, "%.3f", resume, flush_every) as writer:
+                    for x in Xs[writer.n_done:]:
+                        sc_x = cache.get(mdd_model.content_hash(), 'sc', x, params) if cache else None
+                        if sc_x is None:
+                            sc_x = [float(v) for v in explainer.shap_values(x[None, :])[0]]
+                            if cache:
+                                cache.put(mdd_model.content_hash(), 'sc', x, sc_x, params)
+                        writer.write(sc_x)
+
+        hooks.finish()
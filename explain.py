@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#
+#   Lean prediction/explanation entry point
+#   (imports neither sklearn, pandas nor shap, for short-lived processes)
+#
+################################################################################
+import sys
+from omdd import OMDD
+from xpmdd import XpOMDD
+################################################################################
+
+
+# python3 explain.py dt_models/ijar23cs02a.mdd -inst 0,1,0,1 [-xp axp|cxp|enum]
+# python3 explain.py dt_models/ijar23cs02a.mdd -data samples/ijar23cs02a.csv [-xp axp|cxp|enum]
+# (-data also accepts a Parquet file, with pyarrow)
+# python3 explain.py dt_models/ijar23cs02a.mdd -inst 0,1,0,1 -xp minaxp|mincxp [-k 2] [-budget 0.5]
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if len(args) >= 3 and args[1] in ('-inst', '-data'):
+        mdd_model = OMDD.from_file(args[0])
+        if args[1] == '-inst':
+            Xs = [[int(v) for v in args[2].split(',')]]
+        else:
+            Xs = mdd_model.read_samples(args[2]).tolist()
+        xtype = args[args.index('-xp') + 1] if '-xp' in args else None
+        assert xtype in (None, 'axp', 'cxp', 'enum', 'minaxp', 'mincxp')
+
+        if xtype is None:
+            for x in Xs:
+                print(f"Instance: {x}, prediction: {mdd_model.predict_one(x)}")
+        elif xtype in ('minaxp', 'mincxp'):
+            k = int(args[args.index('-k') + 1]) if '-k' in args else None
+            budget = float(args[args.index('-budget') + 1]) if '-budget' in args else None
+            for x in Xs:
+                pred = mdd_model.predict_one(x)
+                xpmdd = XpOMDD(mdd_model, x, pred)
+                if xtype == 'minaxp':
+                    print(f"Instance: {x}, prediction: {pred}, AXp: {xpmdd.find_min_axp(k, budget)}")
+                else:
+                    print(f"Instance: {x}, prediction: {pred}, CXp: {xpmdd.find_min_cxp(k)}")
+        else:
+            res = XpOMDD.explain_batch(mdd_model, Xs, 'both' if xtype == 'enum' else xtype, enum=xtype == 'enum')
+            for x, pred, axps, cxps in zip(Xs, res.preds, res.axps, res.cxps):
+                line = f"Instance: {x}, prediction: {pred}"
+                if axps is not None:
+                    line += f", AXp: {axps if xtype == 'enum' else axps[0]}"
+                if cxps is not None:
+                    line += f", CXp: {cxps if xtype == 'enum' else cxps[0]}"
+                print(line)
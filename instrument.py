@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#
+#   Opt-in instrumentation of OMDD queries (call counts, timing, nodes visited)
+#
+################################################################################
+import json
+import time
+import functools
+from collections import defaultdict
+################################################################################
+
+
+class Instrument(object):
+    """
+        Counters and timers of the hot OMDD queries.
+        When disabled (default), the queries are not wrapped at all;
+        enable() wraps them in place and disable() restores the originals.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.calls = defaultdict(int)       # number of calls
+        self.time = defaultdict(float)      # total time (in seconds)
+        self.nodes = defaultdict(int)       # total number of nodes visited
+        self._patched = []                  # (owner, attribute, original)
+
+    def reset(self):
+        self.calls.clear()
+        self.time.clear()
+        self.nodes.clear()
+
+    def record(self, name, elapsed, nodes=0):
+        self.calls[name] += 1
+        self.time[name] += elapsed
+        self.nodes[name] += nodes
+
+    def add_nodes(self, name, nodes):
+        """
+            Called by the queries themselves, which know how many nodes they visit.
+        """
+        self.nodes[name] += nodes
+
+    def _timed(self, name, fn, count_nodes=None):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start,
+                            count_nodes(*args) if count_nodes else 0)
+        return wrapper
+
+    def _timed_gen(self, name, fn):
+        # only time spent inside the generator is counted, one node per yielded item
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            it = fn(*args, **kwargs)
+            elapsed = 0.0
+            n = 0
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        item = next(it)
+                    except StopIteration:
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - start
+                    n += 1
+                    yield item
+            finally:
+                self.record(name, elapsed, n)
+        return wrapper
+
+    def _timed_solver(self, solver_cls):
+        instrument = self
+
+        class TimedSolver(object):
+            def __init__(self, *args, **kwargs):
+                self._slv = solver_cls(*args, **kwargs)
+
+            def solve(self, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return self._slv.solve(*args, **kwargs)
+                finally:
+                    instrument.record('SAT solve', time.perf_counter() - start)
+
+            def __getattr__(self, name):
+                return getattr(self._slv, name)
+
+            def __enter__(self):
+                self._slv.__enter__()
+                return self
+
+            def __exit__(self, *args):
+                return self._slv.__exit__(*args)
+
+        return TimedSolver
+
+    def _patch(self, owner, attr, new):
+        self._patched.append((owner, attr, owner.__dict__[attr]))
+        setattr(owner, attr, new)
+
+    def enable(self):
+        """
+            Wrap OMDD.path_to_other_class, OMDD.total_assignment, OMDD.dfs_postorder,
+            ReachCache.path_to_other_class, SHAPoMDD.model_counting (and its batch version)
+            and the SAT solver used by XpOMDD.enum.
+        """
+        if self.enabled:
+            return
+        import xpmdd
+        from omdd import OMDD
+        from xpmdd import ReachCache
+        from SHAPmdd import SHAPoMDD
+
+        self._patch(OMDD, 'path_to_other_class',
+                    self._timed('path_to_other_class', OMDD.path_to_other_class))
+        self._patch(OMDD, 'total_assignment',
+                    self._timed('total_assignment', OMDD.total_assignment))
+        self._patch(OMDD, 'dfs_postorder',
+                    self._timed_gen('dfs_postorder', OMDD.dfs_postorder))
+        self._patch(ReachCache, 'path_to_other_class',
+                    self._timed('ReachCache.path_to_other_class', ReachCache.path_to_other_class))
+        # model counting visits every node of the diagram once
+        self._patch(SHAPoMDD, 'model_counting',
+                    self._timed('model_counting', SHAPoMDD.model_counting,
+                                lambda shap_dd, *args: len(shap_dd.dd.topo_order())))
+        self._patch(SHAPoMDD, '_counting_batch',
+                    self._timed('model_counting_batch', SHAPoMDD._counting_batch,
+                                lambda shap_dd, *args: len(shap_dd.dd.topo_order())))
+        xpmdd.load_pysat()
+        self._patch(xpmdd, 'SAT_Solver', self._timed_solver(xpmdd.SAT_Solver))
+        self.enabled = True
+
+    def disable(self):
+        while self._patched:
+            owner, attr, orig = self._patched.pop()
+            setattr(owner, attr, orig)
+        self.enabled = False
+
+    def report(self):
+        """
+            :return: a dictionary with, for each query,
+                        number of calls, total/mean time and nodes visited.
+        """
+        ret = dict()
+        for name in sorted(self.calls, key=self.time.get, reverse=True):
+            calls = self.calls[name]
+            ret[name] = {'calls': calls,
+                         'time': self.time[name],
+                         'time_per_call': self.time[name] / calls,
+                         'nodes': self.nodes[name],
+                         'nodes_per_call': self.nodes[name] / calls}
+        return ret
+
+    def dump(self, filename):
+        with open(filename, 'w') as fp:
+            json.dump(self.report(), fp, indent=2)
+
+
+INSTRUMENT = Instrument()
+
+
+class ExperimentHooks(object):
+    """
+        Instrumentation and profiling of an experiment script, from its command line:
+        -stats FILE                     enable counters, write the report to FILE (JSON);
+        -profile cprofile FILE          run under cProfile, write the stats to FILE;
+        -profile pyinstrument FILE      run under pyinstrument, write the text report to FILE.
+    """
+
+    def __init__(self, args):
+        self.stats_file = args[args.index('-stats') + 1] if '-stats' in args else None
+        self.prof_kind = None
+        self.prof_file = None
+        self.prof = None
+        if '-profile' in args:
+            self.prof_kind = args[args.index('-profile') + 1]
+            self.prof_file = args[args.index('-profile') + 2]
+
+        if self.stats_file:
+            INSTRUMENT.enable()
+        if self.prof_kind == 'cprofile':
+            import cProfile
+            self.prof = cProfile.Profile()
+            self.prof.enable()
+        elif self.prof_kind == 'pyinstrument':
+            from pyinstrument import Profiler
+            self.prof = Profiler()
+            self.prof.start()
+        elif self.prof_kind is not None:
+            raise ValueError(f"Unknown profiler: {self.prof_kind}")
+
+    def finish(self):
+        if self.prof_kind == 'cprofile':
+            self.prof.disable()
+            self.prof.dump_stats(self.prof_file)
+        elif self.prof_kind == 'pyinstrument':
+            self.prof.stop()
+            with open(self.prof_file, 'w') as fp:
+                fp.write(self.prof.output_text())
+        if self.stats_file:
+            INSTRUMENT.dump(self.stats_file)
+            INSTRUMENT.disable()
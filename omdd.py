@@ -3,25 +3,254 @@
 #
 #   Ordered Multi-valued Decision Diagrams (OMDDs)
 ################################################################################
-import networkx as nx
-import numpy as np
-import pandas as pd
-from sklearn.metrics import accuracy_score
+# networkx, numpy and sklearn are imported where needed (fast startup)
 import random
 import itertools
 import csv
-from queue import Queue
+import json
+import hashlib
+import weakref
+from collections import deque
+from instrument import INSTRUMENT
 ################################################################################
 
 
+class CompactStore(object):
+    """
+        Array-based (CSR) storage of an OMDD, for huge diagrams.
+        Nodes are renumbered: terminal nodes are 0..nt-1, non-terminal nodes nt..n-1.
+        The children of a non-terminal node nd are chd[offsets[nd]:offsets[nd+1]],
+        one per value of the domain of its feature (in domain order).
+    """
+    __slots__ = ('ids', 'labels', 'fid', 'offsets', 'chd')
+
+    def __init__(self, ids, labels, fid, offsets, chd):
+        self.ids = ids              # node id (as in the .mdd file) of each node
+        self.labels = labels        # target value of each terminal node
+        self.fid = fid              # feature index of each node (-1 for terminal nodes)
+        self.offsets = offsets      # CSR offsets (int64)
+        self.chd = chd              # CSR children (int32)
+
+    @property
+    def n_terms(self):
+        return len(self.labels)
+
+    @property
+    def n_nodes(self):
+        return len(self.fid)
+
+    @classmethod
+    def from_lists(cls, t_nds, nt_nds, edges, root, features, feat_domain):
+        """
+            Build and check the arrays from lists of nodes and (multi-)edges
+            in the networkx format.
+
+            :return: the store and the (renumbered) root.
+        """
+        import numpy as np
+        ids = [nd for nd, attrs in t_nds] + [nd for nd, attrs in nt_nds]
+        dense = {nd: i for i, nd in enumerate(ids)}
+        assert len(dense) == len(ids)
+        nt = len(t_nds)
+        fidx = {feat: i for i, feat in enumerate(features)}
+        labels = np.array([attrs['target'] for nd, attrs in t_nds], dtype=np.int64)
+        fid = np.full(len(ids), -1, dtype=np.int16 if len(features) < 2 ** 15 else np.int32)
+        for i, (nd, attrs) in enumerate(nt_nds):
+            fid[nt + i] = fidx[attrs['var']]
+        widths = np.zeros(len(ids), dtype=np.int64)
+        widths[nt:] = [len(feat_domain[features[f_id]]) for f_id in fid[nt:]]
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(widths, out=offsets[1:])
+        chd = np.full(offsets[-1], -1, dtype=np.int32)
+
+        val2pos = [{val: pos for pos, val in enumerate(feat_domain[feat])} for feat in features]
+        for nd, c, val in edges:
+            i = dense[nd]
+            assert i >= nt, 'edge from a terminal node'
+            p = offsets[i] + val2pos[fid[i]][val]
+            assert chd[p] == -1, 'duplicate edge'
+            chd[p] = dense[c]
+
+        ########## check MDD: ##########
+        # 1) for each node, in-degree > 0, except root node has 0 in-degree;
+        # 4) for each non-terminal nodes, the number of outgoing edges == domain size.
+        # 6) for each non-terminal nodes, all children nodes are not the same.
+        assert (chd >= 0).all(), 'missing edge'
+        in_deg = np.bincount(chd, minlength=len(ids))
+        root = dense[root]
+        assert in_deg[root] == 0
+        assert (np.delete(in_deg, root) > 0).all()
+        for i in range(nt, len(ids)):
+            assert len(set(chd[offsets[i]:offsets[i + 1]].tolist())) > 1
+        ########## check MDD: ##########
+
+        return cls(np.array(ids, dtype=np.int64), labels, fid, offsets, chd), root
+
+    def to_networkx(self, features, feat_domain):
+        """
+            Materialize the diagram as a networkx multi-edge directed graph
+            (renumbered nodes), for debugging or visualization.
+        """
+        import networkx as nx
+        G = nx.MultiDiGraph()
+        nt = self.n_terms
+        G.add_nodes_from((i, {'target': int(self.labels[i])}) for i in range(nt))
+        G.add_nodes_from((i, {'var': features[self.fid[i]]}) for i in range(nt, self.n_nodes))
+        for i in range(nt, self.n_nodes):
+            dom = feat_domain[features[self.fid[i]]]
+            G.add_edges_from((i, int(c), val) for val, c in zip(dom, self.chd[self.offsets[i]:self.offsets[i + 1]]))
+        return G
+
+
+class _NodeView(object):
+    """
+        Read-only mapping node -> fn(node) over a range of (renumbered) nodes,
+        standing for the lookup tables of OMDD in compact mode.
+    """
+    __slots__ = ('fn', 'lo', 'hi')
+
+    def __init__(self, fn, lo, hi):
+        self.fn = fn
+        self.lo = lo
+        self.hi = hi
+
+    def __contains__(self, nd):
+        return self.lo <= nd < self.hi
+
+    def __getitem__(self, nd):
+        if not self.lo <= nd < self.hi:
+            raise KeyError(nd)
+        return self.fn(nd)
+
+    def __len__(self):
+        return self.hi - self.lo
+
+    def __iter__(self):
+        return iter(range(self.lo, self.hi))
+
+
+class _ChildView(object):
+    """
+        Read-only mapping value -> child of one node in compact mode.
+    """
+    __slots__ = ('chd', 'base', 'val2pos')
+
+    def __init__(self, chd, base, val2pos):
+        self.chd = chd
+        self.base = base
+        self.val2pos = val2pos
+
+    def __contains__(self, val):
+        return val in self.val2pos
+
+    def __getitem__(self, val):
+        return int(self.chd[self.base + self.val2pos[val]])
+
+
+# node digests are combined by a sum modulo 2^256
+_DIGEST_MOD = 2 ** 256
+
+
+def _digest(node, edges):
+    # digest of one node and its out-edges (sorted, multi-edges are distinct by value)
+    blob = json.dumps([node, sorted(edges)], default=str).encode()
+    return int.from_bytes(hashlib.sha256(blob).digest(), 'big')
+
+
+class DomainEncoder(object):
+    """
+        Dense codes of feature values: the code of a value is its position in the domain
+        of its feature (the order of fv_probs, and of the children in compact mode).
+        Columns of raw values are mapped to codes, and back, through lookup tables,
+        in one vectorized step; values out of the domain are detected on the way.
+    """
+
+    # a direct table is used if the range of the values is at most this times the domain size,
+    # a sorted table (binary search) otherwise
+    DENSE_RATIO = 64
+
+    def __init__(self, features, feat_domain, val2code=None):
+        import numpy as np
+        self.features = features
+        self.values = [np.asarray(feat_domain[feat], dtype=np.int64) for feat in features]   # code -> value
+        if val2code is None:
+            val2code = tuple({val: code for code, val in enumerate(feat_domain[feat])} for feat in features)
+        self.val2code = val2code    # value -> code, for each feature index (OMDD.val2pos)
+        self._tables = []
+        for vals in self.values:
+            lo, hi = int(vals.min()), int(vals.max())
+            if hi - lo + 1 <= self.DENSE_RATIO * len(vals):
+                table = np.full(hi - lo + 1, -1, dtype=np.int64)
+                table[vals - lo] = np.arange(len(vals))
+                self._tables.append((lo, table, None))
+            else:
+                order = np.argsort(vals, kind='stable')
+                self._tables.append((None, vals[order], order))
+
+    def encode(self, f_id, col, check=True):
+        """
+            Codes of a column of values of one feature.
+
+            :param f_id: feature index.
+            :param col: a 1-D array of values.
+            :param check: if true, raise ValueError on values out of the domain,
+                        otherwise their code is -1.
+            :return: a 1-D int64 array of codes.
+        """
+        import numpy as np
+        col = np.asarray(col)
+        if col.dtype.kind in 'iu':
+            icol = col.astype(np.int64, copy=False)
+            frac = None
+        else:
+            icol = col.astype(np.int64)
+            frac = icol != col
+            if check and frac.any():
+                raise ValueError(f"{self.features[f_id]}: non-integer values")
+        lo, table, order = self._tables[f_id]
+        if lo is not None:
+            idx = icol - lo
+            inside = (idx >= 0) & (idx < len(table))
+            codes = table[np.where(inside, idx, 0)]
+            codes[~inside] = -1
+        else:
+            pos = np.minimum(np.searchsorted(table, icol), len(table) - 1)
+            codes = np.where(table[pos] == icol, order[pos], -1)
+        if frac is not None:
+            codes[frac] = -1
+        if check and (codes < 0).any():
+            bad = col[codes < 0][0]
+            raise ValueError(f"{self.features[f_id]}: value {bad} not in domain {self.values[f_id].tolist()}")
+        return codes
+
+    def decode(self, f_id, codes):
+        """
+            Values of a column of codes of one feature.
+        """
+        return self.values[f_id][codes]
+
+    def out_of_domain(self, f_id, col):
+        """
+            :return: a boolean mask of the values of a column that are not in the domain.
+        """
+        return self.encode(f_id, col, check=False) < 0
+
+    def code(self, f_id, val):
+        """
+            Code of a single value.
+        """
+        return self.val2code[f_id][val]
+
+
 class OMDD(object):
     """
         OMDD classifiers.
     """
 
     def __init__(self, graph, root, nfeats, features, feat_domain,
-                 target, tar_range, lvl2feat, feat2lvl, verb=0):
-        self.graph = graph                  # MDD (use multi-edge directed graphs)
+                 target, tar_range, lvl2feat, feat2lvl, verb=0, store=None):
+        self._graph = graph                 # MDD (use multi-edge directed graphs), None in compact mode
+        self.store = store                  # array-based storage (compact mode)
         self.root = root                    # root node
         self.nf = nfeats                    # number of features
         self.features = features            # feature names
@@ -32,13 +261,155 @@ class OMDD(object):
         self.lvl2feat = lvl2feat            # level to feature (start from 0, top is level 0, increasing down)
         self.feat2lvl = feat2lvl            # feature to level
         self.verbose = verb
+        self._order = None                  # cached topological order (children before parents)
+        self._hash = None                   # cached content hash
+        self._reports = weakref.WeakSet()   # ModelUpdate reports still in use
+        self._build_index()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.store is not None:
+            # the lookup tables of compact mode are views over the store, rebuilt on load
+            for name in ('nd2fid', 'nd2lvl', 'nd2tar', 'nd2chd', '_succ'):
+                del state[name]
+        # update reports stay with this object, and a loaded copy owns its arrays
+        # (not the shared memory segments of an attached model)
+        del state['_reports']
+        state.pop('_shms', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reports = weakref.WeakSet()
+        if self.store is not None:
+            self._build_views()
+
+    @property
+    def graph(self):
+        """
+            The diagram as a networkx graph,
+            materialized on demand in compact mode.
+        """
+        if self._graph is None:
+            self._graph = self.store.to_networkx(self.features, self.feat_domain)
+        return self._graph
+
+    def compact(self):
+        """
+            Switch to compact mode: move the diagram into a CompactStore
+            and drop the networkx graph and the per-node dictionaries.
+            Nodes are renumbered (store.ids gives the original ids).
+        """
+        if self.store is not None:
+            return
+        self.store, self.root = self.compact_store()
+        self._graph = None
+        self.reset_cache()
+
+    def compact_store(self):
+        """
+            The diagram as a CompactStore (without switching to compact mode).
+
+            :return: the store and the (renumbered) root.
+        """
+        if self.store is not None:
+            return self.store, self.root
+        G = self._graph
+        t_nds = [(nd, G.nodes[nd]) for nd in G.nodes if not G.out_degree(nd)]
+        nt_nds = [(nd, G.nodes[nd]) for nd in G.nodes if G.out_degree(nd)]
+        return CompactStore.from_lists(t_nds, nt_nds, G.edges(keys=True), self.root,
+                                       self.features, self.feat_domain)
+
+    def share(self):
+        """
+            Publish the arrays of this OMDD in shared memory.
+
+            :return: a SharedOMDD handle, picklable, whose attach()
+                        rebuilds the OMDD (in compact mode) in another process without copying.
+        """
+        from shared_omdd import SharedOMDD
+        return SharedOMDD(self)
+
+    def _build_index(self):
+        """
+            Precompute lookup tables, so that queries cost O(1) per node:
+            nd2fid: non-terminal node to feature index,
+            nd2lvl: node to level (terminal nodes are at level nf),
+            nd2tar: terminal node to target value,
+            nd2chd: non-terminal node to a dictionary value -> child,
+            lvl2fid / fid2lvl: level to feature index and back,
+            val2pos: for each feature index, a dictionary value -> position in the domain,
+            dom_prod: dom_prod[lvl] is the product of the domain sizes of the levels above lvl.
+            In compact mode, the per-node tables are views over the arrays of the store.
+        """
+
+        self.lvl2fid = tuple(self.features.index(self.lvl2feat[lvl]) for lvl in range(self.nf))
+        self.fid2lvl = tuple(self.feat2lvl[feat] for feat in self.features)
+        self.val2pos = tuple({val: pos for pos, val in enumerate(self.feat_domain[feat])}
+                             for feat in self.features)
+        self._encoder = None                # DomainEncoder (built on demand)
+        self._routes = dict()               # node -> children by value code (graph mode, on demand)
+        dom_prod = [1]
+        for lvl in range(self.nf):
+            dom_prod.append(dom_prod[-1] * len(self.feat_domain[self.lvl2feat[lvl]]))
+        self.dom_prod = tuple(dom_prod)
+
+        # live ModelUpdate reports keep the old entries of the nodes they did not record yet
+        for upd in list(self._reports):
+            upd.freeze()
+        self._digests = None                # node -> digest (see content_hash, built on demand)
+        self._digest_sum = 0
+        self._unique = None                 # unique table of incremental updates (built on demand)
+        self._fresh = []                    # nodes made for the next update
+        self._next_id = None                # next id of a new node (graph mode, set on first use)
+        if self.store is not None:
+            self._build_views()
+            return
+
+        self.nd2fid = dict()
+        self.nd2lvl = dict()
+        self.nd2tar = dict()
+        self.nd2chd = dict()
+        self._succ = dict()
+        for nd in self._graph.nodes:
+            self._index_node(nd)
+
+    def _index_node(self, nd):
+        # (re)build the lookup table entries of one node (graph mode)
+        G = self._graph
+        for upd in self._reports:
+            upd.record(nd)
+        self._routes.pop(nd, None)
+        self._update_digest(nd)
+        if G.out_degree(nd):
+            f_id = self.features.index(G.nodes[nd]['var'])
+            self.nd2fid[nd] = f_id
+            self.nd2lvl[nd] = self.fid2lvl[f_id]
+            self.nd2chd[nd] = {val: chd for _, chd, val in G.out_edges(nd, keys=True)}
+            self._succ[nd] = tuple((chd, tuple(G[nd][chd])) for chd in G.successors(nd))
+            self.nd2tar.pop(nd, None)
+        else:
+            self.nd2lvl[nd] = self.nf
+            self.nd2tar[nd] = G.nodes[nd]['target']
+            self._succ[nd] = tuple()
+            self.nd2fid.pop(nd, None)
+            self.nd2chd.pop(nd, None)
+
+    def _unindex_node(self, nd):
+        for upd in self._reports:
+            upd.record(nd)
+        self._update_digest(nd, removed=True)
+        for table in (self.nd2fid, self.nd2lvl, self.nd2tar, self.nd2chd, self._succ, self._routes):
+            table.pop(nd, None)
 
     @classmethod
-    def from_file(cls, filename):
+    def from_file(cls, filename, compact=False):
         """
             Load OMDD file.
 
             :param filename: file in .mdd format.
+            :param compact: if true, store the diagram in arrays (CompactStore)
+                        instead of a networkx graph.
             :return: OMDD model.
         """
 
@@ -61,6 +432,7 @@ class OMDD(object):
         edges = []
         all_ts = []
         all_nts = []
+        set_nts = set()     # for membership tests on large diagrams
 
         index = 0
         assert (lines[index].strip().startswith('// attributes domain:'))
@@ -129,8 +501,9 @@ class OMDD(object):
                 nd_line = mdd_line.split(": ")
                 assert len(nd_line) == 3, "incorrect format"
                 nd = int(nd_line[1].rstrip(' down'))
-                assert nd not in all_nts
+                assert nd not in set_nts
                 all_nts.append(nd)
+                set_nts.add(nd)
                 nt_nds.append(tuple((nd, {'var': attr})))
                 if lvl_now == len(attributes):
                     root = nd
@@ -193,7 +566,37 @@ class OMDD(object):
 
             index += 1
 
+        ########## features, feature domain, target, target range ##########
+        feat_domain = dict()
+        lvl2feat = dict()
+        feat2lvl = dict()
+        features = attributes[:]
+        target = features.pop()
+        for feat in features:
+            assert feat in attr_domain
+            feat_domain.update({feat: attr_domain[feat]})
+        assert target in attr_domain
+        tar_range = attr_domain[target]
+        tar_range.sort()
+        lvl2attr.pop(attr2lvl[target], None)
+        attr2lvl.pop(target, None)
+        order_feats = features[:]
+        order_feats.sort(key=attr2lvl.get, reverse=True)
+        for lvl, feat in enumerate(order_feats):
+            lvl2feat.update({lvl: feat})
+            feat2lvl.update({feat: lvl})
+            assert attr2lvl[feat] >= 2
+            assert lvl == len(features)-(attr2lvl[feat]-1)
+        ########## features, feature domain, target, target range ##########
+
+        if compact:
+            # the checks below are done by the array builder
+            store, root = CompactStore.from_lists(t_nds, nt_nds, edges, root, features, feat_domain)
+            return cls(None, root, len(features), features, feat_domain, target, tar_range,
+                       lvl2feat, feat2lvl, store=store)
+
         ##### construct OMDD #####
+        import networkx as nx
         G = nx.MultiDiGraph()
         G.add_nodes_from(t_nds)
         G.add_nodes_from(nt_nds)
@@ -215,7 +618,7 @@ class OMDD(object):
             if G.out_degree(nd) == 0:
                 assert nd in all_ts
             else:
-                assert nd in all_nts
+                assert nd in set_nts
         for nd in G.nodes:
             if G.out_degree(nd):
                 all_chds = set(G.successors(nd))
@@ -230,31 +633,87 @@ class OMDD(object):
                 assert len(all_egs) == len(attr_dom)
         ########## check MDD: ##########
 
-        ########## features, feature domain, target, target range ##########
-        feat_domain = dict()
-        lvl2feat = dict()
-        feat2lvl = dict()
-        features = attributes[:]
-        target = features.pop()
-        for feat in features:
-            assert feat in attr_domain
-            feat_domain.update({feat: attr_domain[feat]})
-        assert target in attr_domain
-        tar_range = attr_domain[target]
-        tar_range.sort()
-        lvl2attr.pop(attr2lvl[target], None)
-        attr2lvl.pop(target, None)
-        order_feats = features[:]
-        order_feats.sort(key=attr2lvl.get, reverse=True)
-        for lvl, feat in enumerate(order_feats):
-            lvl2feat.update({lvl: feat})
-            feat2lvl.update({feat: lvl})
-            assert attr2lvl[feat] >= 2
-            assert lvl == len(features)-(attr2lvl[feat]-1)
-        ########## features, feature domain, target, target range ##########
-
         return cls(G, root, len(features), features, feat_domain, target, tar_range, lvl2feat, feat2lvl)
 
+    def content_hash(self):
+        """
+            Hash of the content of this OMDD (features, domains, levels, nodes and edges),
+            used to key persistent results. Cached.
+            The nodes (each with its out-edges) are hashed separately and combined
+            by a sum, which incremental updates maintain node by node.
+
+            :return: a hexadecimal sha256 digest.
+        """
+
+        if self._hash is None:
+            if self._digests is None:
+                self._digests = dict()
+                if self.store is None:
+                    for nd in self._graph.nodes:
+                        self._digests[nd] = self._node_digest(nd)
+                else:
+                    # same content as in graph mode, with the original node ids
+                    st = self.store
+                    ids = st.ids.tolist()
+                    for i in range(st.n_nodes):
+                        if i < st.n_terms:
+                            self._digests[i] = _digest([ids[i], None, int(st.labels[i])], [])
+                        else:
+                            dom = self.feat_domain[self.features[st.fid[i]]]
+                            chds = st.chd[st.offsets[i]:st.offsets[i + 1]].tolist()
+                            self._digests[i] = _digest([ids[i], self.features[st.fid[i]], None],
+                                                       [[ids[i], ids[c], val] for val, c in zip(dom, chds)])
+                self._digest_sum = sum(self._digests.values()) % _DIGEST_MOD
+            content = {
+                'features': self.features,
+                'feat_domain': [self.feat_domain[feat] for feat in self.features],
+                'levels': [self.feat2lvl[feat] for feat in self.features],
+                'target': self.target,
+                'tar_range': list(self.tar_range),
+                'root': self.root if self.store is None else int(self.store.ids[self.root]),
+                'nodes': f"{self._digest_sum:064x}",
+            }
+            blob = json.dumps(content, sort_keys=True, default=str).encode()
+            self._hash = hashlib.sha256(blob).hexdigest()
+        return self._hash
+
+    def _node_digest(self, nd):
+        # graph mode
+        G = self._graph
+        return _digest([nd, G.nodes[nd].get('var'), G.nodes[nd].get('target')],
+                       [[nd, chd, val] for _, chd, val in G.out_edges(nd, keys=True)])
+
+    def _update_digest(self, nd, removed=False):
+        # keep the node digests (if built) in sync with one re-indexed or removed node
+        if self._digests is None:
+            return
+        old = self._digests.pop(nd, 0)
+        new = 0 if removed else self._node_digest(nd)
+        if not removed:
+            self._digests[nd] = new
+        self._digest_sum = (self._digest_sum - old + new) % _DIGEST_MOD
+
+    def _build_views(self):
+        st = self.store
+        nt = st.n_terms
+        n = st.n_nodes
+        fid2lvl = self.fid2lvl
+        val2pos = self.val2pos
+
+        def succ(nd):
+            # distinct children, with the values of the (multi-)edges leading to them
+            chds = dict()
+            dom = self.feat_domain[self.features[st.fid[nd]]]
+            for val, c in zip(dom, st.chd[st.offsets[nd]:st.offsets[nd + 1]].tolist()):
+                chds.setdefault(c, []).append(val)
+            return tuple((c, tuple(vals)) for c, vals in chds.items())
+
+        self.nd2fid = _NodeView(lambda nd: int(st.fid[nd]), nt, n)
+        self.nd2lvl = _NodeView(lambda nd: fid2lvl[st.fid[nd]] if nd >= nt else self.nf, 0, n)
+        self.nd2tar = _NodeView(lambda nd: int(st.labels[nd]), 0, nt)
+        self.nd2chd = _NodeView(lambda nd: _ChildView(st.chd, st.offsets[nd], val2pos[st.fid[nd]]), nt, n)
+        self._succ = _NodeView(lambda nd: succ(nd) if nd >= nt else tuple(), 0, n)
+
     def set_fv_probs_uniform(self):
         """
             Set the feature-value probabilities to be uniformed.
@@ -267,9 +726,61 @@ class OMDD(object):
     def set_fv_probs(self, fv_probs):
         """
             Set the feature-value probabilities.
-            :param fv_probs: a dictionary of feature-value probabilities.
+            :param fv_probs: a dictionary feature -> probabilities, either a list
+                        aligned with the domain of the feature (value codes)
+                        or a dictionary value -> probability (missing values have probability 0).
+        """
+        probs = dict()
+        for feat, prob in fv_probs.items():
+            dom = self.feat_domain[feat]
+            if isinstance(prob, dict):
+                f_id = self.features.index(feat)
+                aligned = len(dom) * [0.0]
+                for val, p in prob.items():
+                    if val not in self.val2pos[f_id]:
+                        raise ValueError(f"{feat}: value {val} not in domain {dom}")
+                    aligned[self.val2pos[f_id][val]] = p
+                prob = aligned
+            elif len(prob) != len(dom):
+                raise ValueError(f"{feat}: {len(prob)} probabilities for a domain of size {len(dom)}")
+            probs[feat] = list(prob)
+        self.fv_probs = probs
+
+    def set_fv_probs_from_data(self, data):
+        """
+            Set the feature-value probabilities to the frequencies of the values in data.
+            :param data: instances (any input of as_columns).
+        """
+        import numpy as np
+        codes = self.as_codes(data)
+        assert len(codes[0]), 'no instance'
+        self.fv_probs = {feat: (np.bincount(codes[i], minlength=len(self.feat_domain[feat])) / len(codes[i])).tolist()
+                         for i, feat in enumerate(self.features)}
+
+    def value_probs(self, inst):
+        """
+            Probabilities of the values of an instance, in feature order.
         """
-        self.fv_probs = fv_probs
+        return [self.fv_probs[feat][self.val2pos[i][inst[i]]] for i, feat in enumerate(self.features)]
+
+    def read_samples(self, filename):
+        """
+            Read instances from a CSV file whose header contains the feature names
+            (other columns, e.g. the target, are ignored), or from a Parquet file.
+            Values are checked against the feature domains (ValueError).
+
+            :return: a 2-D int64 array, one row per instance.
+        """
+        import numpy as np
+        if filename.endswith('.parquet'):
+            return self.as_matrix(filename)
+        with open(filename, 'r', newline='') as fp:
+            header = next(csv.reader(fp))
+        cols = [header.index(feat) for feat in self.features]
+        X = np.loadtxt(filename, delimiter=',', skiprows=1, usecols=cols, dtype=np.int64, ndmin=2)
+        for i in range(self.nf):
+            self.encoder.encode(i, X[:, i])
+        return X
 
     def gen_function(self, filename):
         """
@@ -297,18 +808,17 @@ class OMDD(object):
         """
 
         nd = self.root
-        G = self.graph
-        while G.out_degree(nd):
-            for chd in G.successors(nd):
-                f_id = self.features.index(G.nodes[nd]['var'])
-                val = assignment[f_id]
-                if tuple((nd, chd, val)) in G.edges:
-                    nd = chd
-                    break
-            else:
-                assert False, 'dead end branch'
-        assert G.out_degree(nd) == 0
-        return G.nodes[nd]['target']
+        nd2chd = self.nd2chd
+        nd2fid = self.nd2fid
+        n_visit = 1
+        while nd in nd2chd:
+            val = assignment[nd2fid[nd]]
+            assert val in nd2chd[nd], 'dead end branch'
+            nd = nd2chd[nd][val]
+            n_visit += 1
+        if INSTRUMENT.enabled:
+            INSTRUMENT.add_nodes('total_assignment', n_visit)
+        return self.nd2tar[nd]
 
     def predict_one(self, in_x):
         """
@@ -325,42 +835,142 @@ class OMDD(object):
         """
             Return a list of prediction given a list of instances.
 
-            :param in_x: a list of total instances.
+            :param in_x: a list of total instances (or any input of as_columns).
             :return: predictions of all instances.
         """
 
-        y_pred = []
-        for ins in in_x:
-            assignment = [int(pt) for pt in ins]
-            y_pred.append(self.total_assignment(assignment))
-        return y_pred
+        return self.predict_batch(in_x).tolist()
 
     def predict(self, data_points):
         """
             Return a list of prediction given a list of data points.
-            :param data_points: input data points
+            :param data_points: input data points (any input of as_columns)
             :return: predictions of these data points.
         """
-        data_pts = data_points
-        if type(data_points) == pd.DataFrame:
-            data_pts = data_points.to_numpy()
-        predictions = []
-        for dp in data_pts:
-            predictions.append(self.total_assignment([int(e) for e in list(dp)]))
-        return np.array(predictions)
+        return self.predict_batch(data_points)
+
+    @property
+    def encoder(self):
+        """
+            The DomainEncoder of the features (value <-> code, built on first use).
+        """
+        if self._encoder is None:
+            self._encoder = DomainEncoder(self.features, self.feat_domain, self.val2pos)
+        return self._encoder
+
+    def _raw_columns(self, data):
+        # one column per feature (in feature order), not checked
+        import numpy as np
+        if isinstance(data, str):
+            import pyarrow.parquet as pq
+            data = pq.read_table(data, columns=self.features)
+        if hasattr(data, 'column_names'):
+            # pyarrow Table or RecordBatch
+            names = data.column_names
+            keys = self.features if all(feat in names for feat in self.features) else range(self.nf)
+            assert len(names) >= self.nf, 'missing feature columns'
+            return [data.column(key).to_numpy() for key in keys]
+        if hasattr(data, 'to_numpy'):
+            # pandas DataFrame (checked without importing pandas)
+            if all(feat in data.columns for feat in self.features):
+                return [data[feat].to_numpy() for feat in self.features]
+            assert data.shape[1] == self.nf, 'missing feature columns'
+            return [data.iloc[:, i].to_numpy() for i in range(self.nf)]
+        X = np.asarray(data)
+        if X.size == 0:
+            X = X.reshape(0, self.nf)
+        assert X.ndim == 2 and X.shape[1] == self.nf, 'expected one column per feature'
+        return [X[:, i] for i in range(self.nf)]
+
+    def as_columns(self, data):
+        """
+            Columns of many instances, one per feature (in feature order),
+            checked in one vectorized step per column (integer values in the feature domain,
+            ValueError otherwise).
+            Integer columns of NumPy arrays, DataFrames and Arrow tables are not copied.
+
+            :param data: a 2-D array or list of instances (columns in feature order),
+                        a pandas DataFrame or a pyarrow Table (columns selected by feature name,
+                        or taken in feature order), or the name of a Parquet file.
+            :return: a list of 1-D integer arrays.
+        """
+        import numpy as np
+        cols = self._raw_columns(data)
+        for i, col in enumerate(cols):
+            self.encoder.encode(i, col)
+        return [col if col.dtype.kind in 'iu' else col.astype(np.int64) for col in cols]
+
+    def as_codes(self, data):
+        """
+            Same as as_columns, with the values replaced by their codes
+            (positions in the feature domains, see DomainEncoder).
+        """
+        return [self.encoder.encode(i, col) for i, col in enumerate(self._raw_columns(data))]
+
+    def as_matrix(self, data):
+        """
+            Same as as_columns, as one 2-D int64 array (rows are instances),
+            e.g. to iterate over instances.
+        """
+        import numpy as np
+        cols = self.as_columns(data)
+        if isinstance(data, np.ndarray) and data.dtype == np.int64:
+            return data
+        return np.column_stack(cols).astype(np.int64, copy=False)
+
+    def predict_batch(self, in_x):
+        """
+            Vectorized prediction of many instances:
+            rows are routed down the diagram in groups, one numpy selection per edge.
+
+            :param in_x: a 2-D array (or list) of total instances, a DataFrame, an Arrow table
+                        or a Parquet file (see as_columns).
+            :return: predictions of these instances.
+        """
+        import numpy as np
+        codes = self.as_codes(in_x)
+        y_pred = np.empty(len(codes[0]), dtype=int)
+        stack = [(self.root, np.arange(len(y_pred)))]
+        while stack:
+            nd, rows = stack.pop()
+            succs = self._succ[nd]
+            if not succs:
+                y_pred[rows] = self.nd2tar[nd]
+                continue
+            dest = self._route(nd)[codes[self.nd2fid[nd]][rows]]
+            n_routed = 0
+            for chd, _ in succs:
+                sel = rows[dest == chd]
+                if len(sel):
+                    stack.append((chd, sel))
+                    n_routed += len(sel)
+            assert n_routed == len(rows), 'dead end branch'
+        return y_pred
+
+    def _route(self, nd):
+        # children of a non-terminal node by value code (-1 for missing edges)
+        if self.store is not None:
+            st = self.store
+            return st.chd[st.offsets[nd]:st.offsets[nd + 1]]
+        route = self._routes.get(nd)
+        if route is None:
+            import numpy as np
+            chds = self.nd2chd[nd]
+            dom = self.feat_domain[self.features[self.nd2fid[nd]]]
+            route = np.array([chds.get(val, -1) for val in dom], dtype=np.int64)
+            self._routes[nd] = route
+        return route
 
     def accuracy(self, in_x, y_true):
         """
             Compare the output of bdd and desired prediction
-            :param in_x: a list of total instances.
+            :param in_x: a list of total instances (or any input of as_columns).
             :param y_true: desired prediction
             :return: accuracy in float.
         """
 
-        y_pred = []
-        for ins in in_x:
-            assignment = [int(pt) for pt in ins]
-            y_pred.append(self.total_assignment(assignment))
+        y_pred = self.predict_all(in_x)
+        from sklearn.metrics import accuracy_score
         acc = accuracy_score(y_true, y_pred)
         return acc
 
@@ -375,29 +985,32 @@ class OMDD(object):
             :return: true if there is a path to 0 else false.
         """
 
-        G = self.graph
-        # BFS (Breadth-first search)
-        q = Queue()
-        q.put(self.root)
-        while not q.empty():
-            nd = q.get()
-            if not G.out_degree(nd):
-                if G.nodes[nd]['target'] != tar:
-                    return True
+        ret = False
+        n_visit = 0
+        # BFS (Breadth-first search), each node is visited at most once
+        q = deque([self.root])
+        seen = {self.root}
+        while q:
+            nd = q.popleft()
+            n_visit += 1
+            if nd in self.nd2tar:
+                if self.nd2tar[nd] != tar:
+                    ret = True
+                    break
             else:
-                f_id = self.features.index(G.nodes[nd]['var'])
-                val = inst[f_id]
+                f_id = self.nd2fid[nd]
                 if univ[f_id]:
-                    for chd in G.successors(nd):
-                        q.put(chd)
+                    chds = [chd for chd, vals in self._succ[nd]]
                 else:
-                    for chd in G.successors(nd):
-                        if tuple((nd, chd, val)) in G.edges:
-                            q.put(chd)
-                            break
-                    else:
-                        assert False, 'dead end branch'
-        return False
+                    assert inst[f_id] in self.nd2chd[nd], 'dead end branch'
+                    chds = [self.nd2chd[nd][inst[f_id]]]
+                for chd in chds:
+                    if chd not in seen:
+                        seen.add(chd)
+                        q.append(chd)
+        if INSTRUMENT.enabled:
+            INSTRUMENT.add_nodes('path_to_other_class', n_visit)
+        return ret
 
     def dfs_postorder(self, root):
         """
@@ -407,14 +1020,495 @@ class OMDD(object):
             :return: a set of nodes in DFS-post-order.
         """
 
-        #####################################################
-        def _dfs_postorder(dd, nd, visited):
-            if dd.out_degree(nd):
-                for chd in dd.successors(nd):
-                    yield from _dfs_postorder(dd, chd, visited)
-            if nd not in visited:
-                visited.add(nd)
+        if root == self.root:
+            yield from self.topo_order()
+        else:
+            yield from self._dfs_postorder(root)
+
+    def topo_order(self):
+        """
+            Nodes reachable from the root in DFS post-order
+            (children before parents), computed once and cached.
+
+            :return: a tuple of nodes (an int32 array in compact mode).
+        """
+
+        if self._order is None:
+            if self.store is None:
+                self._order = tuple(self._dfs_postorder(self.root))
+            else:
+                import numpy as np
+                self._order = np.fromiter(self._dfs_postorder(self.root), dtype=np.int32)
+        return self._order
+
+    def _dfs_postorder(self, root):
+        """
+            Uncached, iterative DFS post-order from any node
+            (one successor iterator per node on the current path).
+
+            :param root: a node of OMDD.
+            :return: a generator of nodes in DFS-post-order.
+        """
+
+        visited = {root}
+        stack = [(root, iter(self._succ[root]))]
+        while stack:
+            nd, succs = stack[-1]
+            for chd, vals in succs:
+                if chd not in visited:
+                    visited.add(chd)
+                    stack.append((chd, iter(self._succ[chd])))
+                    break
+            else:
+                stack.pop()
                 yield nd
 
-        #####################################################
-        yield from _dfs_postorder(self.graph, root, set())
+    def children(self, nd):
+        """
+            Distinct children of a node, each with the values
+            labelling the (multi-)edges leading to it (precomputed).
+
+            :param nd: a node of OMDD.
+            :return: a tuple of (child, tuple of values) pairs,
+                        empty for terminal nodes.
+        """
+
+        return self._succ[nd]
+
+    def reset_cache(self):
+        """
+            Drop cached structures and rebuild the lookup tables,
+            must be called after the graph is modified.
+        """
+        self._order = None
+        self._hash = None
+        self._build_index()
+
+    def bottom_up(self, term_val, edge_val):
+        """
+            Generic bottom-up dynamic programming over the cached topological order.
+            The value of a terminal node is term_val(label),
+            the value of a non-terminal node nd is the sum over its distinct children chd
+            of edge_val(nd, chd, vals, value of chd),
+            where vals are the values labelling the (multi-)edges from nd to chd.
+            Values can be numpy arrays, in which case many queries
+            (e.g. many universal masks or many instances) are evaluated in one pass.
+
+            :param term_val: function mapping a terminal label to its value.
+            :param edge_val: function combining an edge with the value of its child.
+            :return: a dictionary mapping each node to its value.
+        """
+
+        value = dict()
+        for nd in self.topo_order():
+            succs = self._succ[nd]
+            if not succs:
+                value[nd] = term_val(self.nd2tar[nd])
+            else:
+                total = 0
+                for chd, vals in succs:
+                    total = total + edge_val(nd, chd, vals, value[chd])
+                value[nd] = total
+        return value
+
+    def paths(self, tar=None):
+        """
+            Iterate through root-to-terminal paths, lazily.
+            Multi-edges between a node and the same child are merged,
+            so each path is a cube (partial assignment).
+
+            :param tar: if given, only paths reaching terminals labelled
+                        with this target value are generated.
+            :return: a generator of (cube, label) pairs, where cube is a dictionary
+                        mapping each tested feature to the set of its values on the path.
+        """
+
+        # prune nodes from which no terminal labelled tar is reachable
+        alive = None
+        if tar is not None:
+            alive = set()
+            for nd in self.topo_order():
+                if nd in self.nd2tar:
+                    if self.nd2tar[nd] == tar:
+                        alive.add(nd)
+                elif any(chd in alive for chd, vals in self._succ[nd]):
+                    alive.add(nd)
+            if self.root not in alive:
+                return
+
+        # constant function: one empty cube
+        if self.root in self.nd2tar:
+            yield dict(), self.nd2tar[self.root]
+            return
+
+        # iterative DFS, one successor iterator per node on the current path
+        cube = dict()
+        stack = [(self.root, iter(self._succ[self.root]))]
+        while stack:
+            nd, succs = stack[-1]
+            feat = self.features[self.nd2fid[nd]]
+            for chd, vals in succs:
+                if alive is not None and chd not in alive:
+                    continue
+                cube[feat] = set(vals)
+                if chd in self.nd2chd:
+                    stack.append((chd, iter(self._succ[chd])))
+                else:
+                    yield {f: set(vs) for f, vs in cube.items()}, self.nd2tar[chd]
+                break
+            else:
+                stack.pop()
+                cube.pop(feat, None)
+
+    def count_paths(self, tar=None):
+        """
+            Count root-to-terminal paths (cubes) without enumerating them.
+
+            :param tar: if given, only count paths reaching terminals
+                        labelled with this target value.
+            :return: number of paths.
+        """
+
+        cnt = self.bottom_up(lambda label: int(tar is None or label == tar),
+                             lambda nd, chd, vals, c: c)
+        return cnt[self.root]
+
+    def reachable_labels(self, nd):
+        """
+            Target values of the terminal nodes reachable from a node.
+        """
+
+        return {self.nd2tar[n] for n in self._dfs_postorder(nd) if n in self.nd2tar}
+
+    def _unique_key(self, nd):
+        if nd in self.nd2tar:
+            return 'T', self.nd2tar[nd]
+        f_id = self.nd2fid[nd]
+        chd = self.nd2chd[nd]
+        return (f_id,) + tuple(chd[val] for val in self.feat_domain[self.features[f_id]])
+
+    def _unique_table(self):
+        # one node per (feature, children) and per terminal label
+        if self._unique is None:
+            self._unique = {self._unique_key(nd): nd for nd in self._graph.nodes}
+        return self._unique
+
+    def _set_children(self, nd, chd_map):
+        G = self._graph
+        unique = self._unique_table()
+        key = self._unique_key(nd)
+        if unique.get(key) == nd:
+            del unique[key]
+        G.remove_edges_from(list(G.out_edges(nd, keys=True)))
+        G.add_edges_from((nd, chd, val) for val, chd in chd_map.items())
+        self._index_node(nd)
+
+    def _replace(self, old, new):
+        # redirect every edge (and the root) leading to old to new
+        parents = set(self._graph.predecessors(old))
+        for p in parents:
+            self._set_children(p, {val: new if chd == old else chd for val, chd in self.nd2chd[p].items()})
+        if self.root == old:
+            self.root = new
+        return parents
+
+    def _reduce(self, todo):
+        # merge redundant and duplicate nodes, upwards from the given nodes,
+        # return the merged (now unreachable) nodes
+        G = self._graph
+        unique = self._unique_table()
+        merged = []
+        todo = list(todo)
+        while todo:
+            nd = todo.pop()
+            if nd not in G or nd in self.nd2tar:
+                continue
+            chds = set(self.nd2chd[nd].values())
+            if len(chds) == 1:
+                other = chds.pop()
+            else:
+                key = self._unique_key(nd)
+                other = unique.get(key)
+                if other is None or other not in G:
+                    unique[key] = other = nd
+            if other != nd:
+                todo.extend(self._replace(nd, other))
+                merged.append(nd)
+        return merged
+
+    def _collect(self, cands):
+        # remove the nodes that are no longer reachable from the root
+        G = self._graph
+        unique = self._unique_table()
+        removed = []
+        todo = list(cands)
+        while todo:
+            nd = todo.pop()
+            if nd not in G or nd == self.root or G.in_degree(nd):
+                continue
+            key = self._unique_key(nd)
+            if unique.get(key) == nd:
+                del unique[key]
+            todo.extend(chd for chd, vals in self._succ[nd])
+            G.remove_node(nd)
+            self._unindex_node(nd)
+            removed.append(nd)
+        return removed
+
+    def _to_graph(self):
+        # updates need the graph: leave compact mode, nodes keep their (renumbered) ids
+        # and the content hash is kept, since the diagram is the same
+        if self.store is not None:
+            model = self.content_hash()
+            self._graph = self.graph
+            self.store = None
+            self.reset_cache()
+            self._hash = model
+
+    def _begin_update(self):
+        self._to_graph()
+        upd = ModelUpdate(self)
+        self._reports.add(upd)
+        return upd
+
+    def _end_update(self, upd, todo, cands):
+        merged = self._reduce(todo)
+        # nodes made for this update but left unused are dropped too
+        upd.removed = self._collect(list(cands) + merged + self._fresh)
+        self._fresh = []
+        self._order = None
+        self._hash = None
+        upd.new_hash = self.content_hash()
+        return upd
+
+    def _new_id(self):
+        # running counter of node ids (graph mode), ids are never reused
+        if self._next_id is None:
+            self._next_id = max(self._graph.nodes) + 1
+        self._next_id += 1
+        return self._next_id - 1
+
+    def make_node(self, feat, children):
+        """
+            Find or create, through the unique table, the node testing a feature
+            with the given children (the result is reduced: a node whose children
+            are all the same is that child). Use it to build a new subfunction
+            for redirect or replace_subfunction.
+
+            :param feat: feature name.
+            :param children: a dictionary mapping each value of the domain of feat to a node
+                        (at a lower level).
+            :return: a node.
+        """
+
+        self._to_graph()
+        f_id = self.features.index(feat)
+        assert set(children) == set(self.feat_domain[feat])
+        assert all(self.nd2lvl[chd] > self.fid2lvl[f_id] for chd in children.values())
+        if len(set(children.values())) == 1:
+            return next(iter(children.values()))
+        unique = self._unique_table()
+        key = (f_id,) + tuple(children[val] for val in self.feat_domain[feat])
+        if key not in unique:
+            nd = self._new_id()
+            self._graph.add_node(nd, var=feat)
+            self._graph.add_edges_from((nd, chd, val) for val, chd in children.items())
+            self._index_node(nd)
+            self._fresh.append(nd)
+            unique[key] = nd
+        return unique[key]
+
+    def make_terminal(self, target):
+        """
+            Find or create the terminal node of a target value.
+
+            :return: a node.
+        """
+
+        self._to_graph()
+        assert target in self.tar_range
+        unique = self._unique_table()
+        if ('T', target) not in unique:
+            nd = self._new_id()
+            self._graph.add_node(nd, target=target)
+            self._index_node(nd)
+            self._fresh.append(nd)
+            unique['T', target] = nd
+        return unique['T', target]
+
+    def relabel_terminal(self, nd, target):
+        """
+            Change the target value of a terminal node (e.g. flipped leaves),
+            then re-reduce the diagram locally.
+
+            :param nd: a terminal node.
+            :param target: its new target value.
+            :return: a ModelUpdate report.
+        """
+
+        assert nd in self.nd2tar and target in self.tar_range
+        upd = self._begin_update()
+        old = self.nd2tar[nd]
+        if old == target:
+            return self._end_update(upd, [], [])
+        upd.mark_node(nd, {old}, {target})
+        unique = self._unique_table()
+        other = unique.get(('T', target))
+        if other is not None and other in self._graph:
+            return self._end_update(upd, self._replace(nd, other), [nd])
+        if unique.get(('T', old)) == nd:
+            del unique['T', old]
+        self._graph.nodes[nd]['target'] = target
+        self._index_node(nd)
+        unique['T', target] = nd
+        return self._end_update(upd, [], [])
+
+    def redirect(self, nd, val, chd):
+        """
+            Replace the subfunction below one edge: the edge of nd labelled val
+            now leads to chd, then re-reduce the diagram locally.
+
+            :param nd: a non-terminal node.
+            :param val: a value of the feature tested by nd.
+            :param chd: a node at a lower level than nd.
+            :return: a ModelUpdate report.
+        """
+
+        assert nd in self.nd2chd and val in self.nd2chd[nd]
+        assert self.nd2lvl[chd] > self.nd2lvl[nd]
+        upd = self._begin_update()
+        old = self.nd2chd[nd][val]
+        if old == chd:
+            return self._end_update(upd, [], [])
+        upd.mark_edge(nd, val, self.reachable_labels(old), self.reachable_labels(chd))
+        self._set_children(nd, {v: chd if v == val else c for v, c in self.nd2chd[nd].items()})
+        return self._end_update(upd, [nd], [old])
+
+    def replace_subfunction(self, nd, new):
+        """
+            Replace the subfunction at a node: every edge leading to nd
+            now leads to new, then re-reduce the diagram locally.
+
+            :param nd: a node.
+            :param new: a node at a lower level than all the parents of nd.
+            :return: a ModelUpdate report.
+        """
+
+        assert nd in self.nd2lvl and new in self.nd2lvl
+        assert all(self.nd2lvl[p] < self.nd2lvl[new] for p in self.graph.predecessors(nd))
+        upd = self._begin_update()
+        if nd == new:
+            return self._end_update(upd, [], [])
+        upd.mark_node(nd, self.reachable_labels(nd), self.reachable_labels(new))
+        return self._end_update(upd, self._replace(nd, new), [nd])
+
+
+class ModelUpdate(object):
+    """
+        Report of an incremental update of an OMDD:
+        content hashes before and after, and the changed region, i.e.
+        the instances whose path in the old diagram goes through a modified node or edge.
+        It tells which cached results (keyed by the old hash) are still valid.
+        The report only keeps the old lookup table entries of the nodes changed since it was made
+        (recorded by the OMDD when they change), the other nodes are read in the live tables,
+        so an update costs time in the size of the changed region only
+        (content hashes are maintained node by node, see OMDD.content_hash).
+    """
+
+    # results that only depend on which instances are predicted like the explained one
+    CLASS_KINDS = ('pred', 'axp', 'cxp', 'enum', 'frp', 's_sc')
+
+    def __init__(self, dd: OMDD):
+        self.old_hash = dd.content_hash()
+        self.new_hash = None
+        self.root = dd.root
+        self._dd = dd
+        # old lookup table entries (feature index, children, target) of the changed nodes,
+        # the whole old tables once frozen
+        self._old = dict()
+        self._frozen = False
+        self.dirty_nodes = set()        # nodes whose subfunction changed
+        self.dirty_edges = set()        # (node, value) edges whose subfunction changed
+        self.labels = set()             # target values involved in the changed region (before and after)
+        self.removed = []               # nodes removed by the re-reduction
+
+    def record(self, nd):
+        """
+            Keep the old entries of a node that is about to change (called by the OMDD).
+        """
+        if nd not in self._old:
+            dd = self._dd
+            self._old[nd] = (dd.nd2fid.get(nd), dd.nd2chd.get(nd), dd.nd2tar.get(nd))
+
+    def freeze(self):
+        """
+            Keep the old entries of all the nodes, before the OMDD rebuilds its tables
+            (e.g. compact() renumbers the nodes), the report no longer reads the live tables.
+        """
+        if not self._frozen:
+            dd = self._dd
+            for nd in dd.nd2lvl:
+                self.record(nd)
+            self._frozen = True
+            dd._reports.discard(self)
+            self._dd = None
+
+    def _entry(self, nd):
+        if nd in self._old:
+            return self._old[nd]
+        dd = self._dd
+        return dd.nd2fid.get(nd), dd.nd2chd.get(nd), dd.nd2tar.get(nd)
+
+    def mark_node(self, nd, old_labels, new_labels):
+        self.dirty_nodes.add(nd)
+        self.labels |= set(old_labels) | set(new_labels)
+
+    def mark_edge(self, nd, val, old_labels, new_labels):
+        self.dirty_edges.add((nd, val))
+        self.labels |= set(old_labels) | set(new_labels)
+
+    @property
+    def changed(self):
+        return bool(self.dirty_nodes or self.dirty_edges)
+
+    def old_path(self, inst):
+        """
+            Follow an instance in the old diagram.
+
+            :return: whether it is in the changed region, and its old prediction.
+        """
+
+        nd = self.root
+        in_region = nd in self.dirty_nodes
+        f_id, chds, tar = self._entry(nd)
+        while chds is not None:
+            val = inst[f_id]
+            in_region = in_region or (nd, val) in self.dirty_edges
+            nd = chds[val]
+            in_region = in_region or nd in self.dirty_nodes
+            f_id, chds, tar = self._entry(nd)
+        return in_region, tar
+
+    def invalidates(self, kind, inst):
+        """
+            Whether a result cached for the old diagram must be recomputed.
+            Predictions change only in the changed region. Explanations ('axp', 'cxp', 'enum', 'frp')
+            and similarity SHAP scores ('s_sc') of an instance predicted as c only depend on which
+            instances are predicted as c, so they are kept if c is not involved in the changed region.
+            Other results (e.g. expected-value SHAP scores, 'sc') depend on the whole function.
+
+            :param kind: kind of result (as in ResultCache).
+            :param inst: the instance of the result.
+            :return: true if the result is invalidated.
+        """
+
+        if not self.changed:
+            return False
+        in_region, pred = self.old_path(inst)
+        if in_region:
+            return True
+        if kind == 'pred':
+            return False
+        if kind in self.CLASS_KINDS:
+            return pred in self.labels
+        return True
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#
+#   Persistent (on-disk) cache of explanations and SHAP scores
+#
+################################################################################
+import json
+import sqlite3
+################################################################################
+
+
+class ResultCache(object):
+    """
+        Content-addressed result cache backed by SQLite.
+        A result is keyed by the OMDD content hash, the kind of result
+        (e.g. 'frp', 'sc', 's_sc'), the instance and a parameter string
+        (value function, seed, ...). Each put is committed immediately,
+        so an interrupted run keeps everything computed so far.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.conn = sqlite3.connect(filename)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS results ("
+                          "model TEXT, kind TEXT, inst TEXT, params TEXT, value TEXT, "
+                          "PRIMARY KEY (model, kind, inst, params))")
+        self.conn.commit()
+
+    @staticmethod
+    def _key(model, kind, inst, params):
+        return model, kind, json.dumps([int(v) for v in inst]), params
+
+    def get(self, model, kind, inst, params=''):
+        """
+            Look up a result.
+
+            :param model: OMDD content hash.
+            :param kind: kind of result.
+            :param inst: given instance.
+            :param params: parameters the result depends on.
+            :return: the cached value, None if absent.
+        """
+        row = self.conn.execute("SELECT value FROM results WHERE model=? AND kind=? AND inst=? AND params=?",
+                                self._key(model, kind, inst, params)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, model, kind, inst, value, params=''):
+        """
+            Store (and commit) a result, value must be JSON serializable.
+        """
+        self.conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                          self._key(model, kind, inst, params) + (json.dumps(value),))
+        self.conn.commit()
+
+    def migrate(self, old_model, new_model, keep):
+        """
+            Copy the results of a model that are still valid for an updated model
+            (e.g. keep = lambda kind, inst: not update.invalidates(kind, inst) for an OMDD.ModelUpdate).
+
+            :param old_model: content hash before the update.
+            :param new_model: content hash after the update.
+            :param keep: function (kind, instance) -> true if the result is still valid.
+            :return: numbers of copied and dropped results.
+        """
+        rows = self.conn.execute("SELECT kind, inst, params, value FROM results WHERE model=?",
+                                 (old_model,)).fetchall()
+        kept = [(new_model, kind, inst, params, value) for kind, inst, params, value in rows
+                if keep(kind, json.loads(inst))]
+        self.conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)", kept)
+        self.conn.commit()
+        return len(kept), len(rows) - len(kept)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#
+#   Streaming (resumable) writer of result files
+#
+################################################################################
+import os
+################################################################################
+
+
+class ResultWriter(object):
+    """
+        Write a result CSV row by row, in the same format as
+        np.savetxt(filename, rows, delimiter=",", header=header, comments="", fmt=fmt),
+        flushing every flush_every rows.
+        If resume is set and the file exists, the rows already written are kept
+        (a truncated last row is dropped) and n_done tells where to restart.
+    """
+
+    def __init__(self, filename, features, fmt, resume=False, flush_every=1):
+        self.filename = filename
+        self.fmt = fmt
+        self.flush_every = flush_every
+        self.n_done = 0             # number of rows in the file
+        self.n_pending = 0          # number of rows written since the last flush
+        header = ",".join(features).lstrip("#")
+
+        if resume and os.path.exists(filename):
+            with open(filename, 'rb') as fp:
+                content = fp.read()
+            # keep complete lines only
+            content = content[:content.rfind(b'\n') + 1]
+            lines = content.decode().splitlines()
+            if lines and lines[0] == header:
+                self.n_done = len(lines) - 1
+                with open(filename, 'r+b') as fp:
+                    fp.truncate(len(content))
+                self.fp = open(filename, 'a', newline='')
+                return
+
+        self.fp = open(filename, 'w', newline='')
+        self.fp.write(header + '\n')
+        self.fp.flush()
+
+    def write(self, row):
+        """
+            Append one row.
+
+            :param row: a list of numbers.
+        """
+        self.fp.write(",".join([self.fmt] * len(row)) % tuple(row) + '\n')
+        self.n_done += 1
+        self.n_pending += 1
+        if self.n_pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        self.fp.flush()
+        os.fsync(self.fp.fileno())
+        self.n_pending = 0
+
+    def close(self):
+        if not self.fp.closed:
+            self.flush()
+            self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
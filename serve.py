@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#
+#   Long-running explanation server
+#   (JSON lines over a TCP or Unix socket, models shared in a registry,
+#   CPU work in a process pool, micro-batched predictions)
+#
+################################################################################
+import os
+import sys
+import json
+import random
+import asyncio
+import socket
+from concurrent.futures import ProcessPoolExecutor
+from omdd import OMDD
+from xpmdd import XpOMDD
+from shared_omdd import attached, shap_explainer
+################################################################################
+
+
+def load_model(path):
+    """
+        Load an OMDD deterministically, so that a model keeps the same hash
+        across restarts of the server (from_file resolves unknown branches randomly).
+    """
+    state = random.getstate()
+    random.seed(path)
+    try:
+        return OMDD.from_file(path)
+    finally:
+        random.setstate(state)
+
+
+def _work(handle, op, inst, params):
+    """
+        Run one CPU-bound request in a worker process,
+        the model is attached (once per worker) from shared memory.
+    """
+    # (the reachability memo is not used, it would grow for the whole life of the server)
+    dd, _ = attached(handle)
+    if op == 'predict':
+        return {'preds': [int(p) for p in dd.predict_batch(inst)]}
+    pred = dd.predict_one(inst)
+    if op == 'find_axp':
+        return {'pred': pred, 'axp': XpOMDD(dd, inst, pred).find_axp()}
+    if op == 'find_cxp':
+        return {'pred': pred, 'cxp': XpOMDD(dd, inst, pred).find_cxp()}
+    if op == 'enum':
+        axps, cxps = XpOMDD(dd, inst, pred).enum()
+        return {'pred': pred, 'axps': axps, 'cxps': cxps}
+    if op == 'shap':
+        # counting tables are kept per worker (bounded, see SHAPoMDD.precompute)
+        vtype = params.get('vtype', 'expected')
+        return {'pred': pred, 'scores': shap_explainer(handle).shap_scores(inst, vtype)}
+    raise ValueError(f"Unknown operation: {op}")
+
+
+################################################################################
+
+
+class ExplanationServer(object):
+    """
+        Serve predictions, explanations and SHAP scores of registered OMDDs.
+        Each request is one JSON object per line, e.g.
+            {"id": 1, "op": "load", "path": "dt_models/ijar23cs02a.mdd"}
+            {"id": 2, "op": "predict", "model": <hash>, "inst": [0, 1, 0, 1]}
+        ops: load, models, predict, find_axp, find_cxp, enum, shap (with optional "vtype").
+        Each response is one JSON object per line, echoing the request id.
+    """
+
+    def __init__(self, workers=None, batch_window=0.002, max_batch=4096, verb=0):
+        self.registry = dict()              # model hash -> (path, OMDD, SharedOMDD handle)
+        self.pool = ProcessPoolExecutor(workers)
+        # start the workers now: forked while serving, they would inherit
+        # the open client sockets, and closed connections would never reach EOF
+        for fut in [self.pool.submit(int) for _ in range(workers or os.cpu_count())]:
+            fut.result()
+        self.batch_window = batch_window    # seconds to wait for concurrent predictions
+        self.max_batch = max_batch          # max number of merged predictions
+        self.pending = dict()               # model hash -> list of (instance, future)
+        self.verbose = verb
+
+    def register(self, path):
+        """
+            Load an OMDD into the registry.
+
+            :return: its content hash.
+        """
+        dd = load_model(path)
+        model = dd.content_hash()
+        if model not in self.registry:
+            dd.set_fv_probs_uniform()
+            # workers attach the published arrays instead of reloading the file
+            self.registry[model] = (path, dd, dd.share())
+        return model
+
+    async def predict(self, model, inst):
+        """
+            Predictions of concurrent requests on the same model
+            are merged into one vectorized traversal.
+        """
+        fut = asyncio.get_running_loop().create_future()
+        if model not in self.pending:
+            self.pending[model] = []
+            asyncio.get_running_loop().call_later(self.batch_window, self._flush_predict, model)
+        batch = self.pending[model]
+        batch.append((inst, fut))
+        if len(batch) >= self.max_batch:
+            self._flush_predict(model)
+        return await fut
+
+    def _flush_predict(self, model):
+        batch = self.pending.pop(model, None)
+        if not batch:
+            return
+        handle = self.registry[model][2]
+        task = asyncio.get_running_loop().run_in_executor(
+            self.pool, _work, handle, 'predict', [inst for inst, fut in batch], None)
+
+        def done(task):
+            try:
+                preds = task.result()['preds']
+                for (inst, fut), pred in zip(batch, preds):
+                    if not fut.done():
+                        fut.set_result(pred)
+            except Exception as e:
+                for inst, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+        task.add_done_callback(done)
+
+    async def dispatch(self, req):
+        op = req.get('op')
+        if op == 'load':
+            model = self.register(req['path'])
+            dd = self.registry[model][1]
+            return {'model': model, 'features': dd.features, 'target': dd.target}
+        if op == 'models':
+            return {'models': {model: path for model, (path, dd, handle) in self.registry.items()}}
+        model = req['model']
+        if model not in self.registry:
+            raise KeyError(f"Unknown model: {model}")
+        path, dd, handle = self.registry[model]
+        inst = [int(v) for v in req['inst']]
+        assert len(inst) == dd.nf
+        # checked before micro-batching, so that a bad instance only fails its own request
+        for i, val in enumerate(inst):
+            dd.encoder.encode(i, [val])
+        if op == 'predict':
+            return {'pred': await self.predict(model, inst)}
+        return await asyncio.get_running_loop().run_in_executor(
+            self.pool, _work, handle, op, inst, req)
+
+    async def _answer(self, req, writer, lock):
+        try:
+            resp = await self.dispatch(req)
+        except Exception as e:
+            resp = {'error': f"{type(e).__name__}: {e}"}
+        resp['id'] = req.get('id')
+        async with lock:
+            writer.write((json.dumps(resp) + '\n').encode())
+            await writer.drain()
+
+    async def handle(self, reader, writer):
+        # requests of one connection are answered concurrently (responses carry the id)
+        lock = asyncio.Lock()
+        tasks = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            try:
+                req = json.loads(line)
+            except ValueError as e:
+                req = {'op': None, 'error': str(e)}
+            tasks.append(asyncio.ensure_future(self._answer(req, writer, lock)))
+        if tasks:
+            await asyncio.gather(*tasks)
+        writer.close()
+
+    async def serve(self, host=None, port=None, unix=None):
+        if unix:
+            server = await asyncio.start_unix_server(self.handle, path=unix)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        if self.verbose:
+            print(f"serving on {unix if unix else (host, port)}")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.pool.shutdown()
+        for path, dd, handle in self.registry.values():
+            handle.unlink()
+
+
+def query(reqs, host='127.0.0.1', port=None, unix=None):
+    """
+        Minimal blocking client, send requests and collect their responses.
+
+        :param reqs: a list of requests (dictionaries).
+        :return: a list of responses, in the order of the requests.
+    """
+    if unix:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(unix)
+    else:
+        sock = socket.create_connection((host, port))
+    reqs = [dict(req, id=i) for i, req in enumerate(reqs)]
+    with sock, sock.makefile('rw') as fp:
+        for req in reqs:
+            fp.write(json.dumps(req) + '\n')
+        fp.flush()
+        sock.shutdown(socket.SHUT_WR)
+        resps = [json.loads(line) for line in fp if line.strip()]
+    resps.sort(key=lambda resp: resp['id'])
+    return resps
+
+
+# python3 serve.py (-port 8765 | -unix /tmp/omdd.sock) [-workers 4] [-models dt_models/ijar23cs02a.mdd ...]
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if '-port' in args or '-unix' in args:
+        workers = int(args[args.index('-workers') + 1]) if '-workers' in args else None
+        server = ExplanationServer(workers=workers, verb=1)
+        if '-models' in args:
+            for path in args[args.index('-models') + 1:]:
+                if path.startswith('-'):
+                    break
+                print(f"{path}: {server.register(path)}")
+        try:
+            if '-unix' in args:
+                asyncio.run(server.serve(unix=args[args.index('-unix') + 1]))
+            else:
+                asyncio.run(server.serve('127.0.0.1', int(args[args.index('-port') + 1])))
+        finally:
+            server.close()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#
+#   Shared-memory distribution of OMDDs to worker processes
+#
+################################################################################
+import numpy as np
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from omdd import OMDD, CompactStore
+################################################################################
+
+
+def _attach_shm(name):
+    # only the publisher unlinks the segments; before python 3.13 attaching registers
+    # the segment again with the resource tracker, which is harmless for workers started
+    # by the publisher (they share its tracker, registrations are a set)
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedOMDD(object):
+    """
+        Handle of an OMDD published in shared memory.
+        The arrays of its CompactStore live in shared memory segments,
+        the handle itself only holds their names and the (small) model metadata,
+        so it is cheap to pickle, and attach() rebuilds the OMDD without copying the arrays.
+        The publisher must call unlink() once all workers are done.
+    """
+
+    ARRAYS = ('ids', 'labels', 'fid', 'offsets', 'chd')
+
+    def __init__(self, dd: OMDD):
+        # the given OMDD is left unchanged (a compact copy is made if needed)
+        store, root = dd.compact_store()
+        self.meta = {'root': root, 'nfeats': dd.nf, 'features': dd.features,
+                     'feat_domain': dd.feat_domain, 'target': dd.target, 'tar_range': dd.tar_range,
+                     'lvl2feat': dd.lvl2feat, 'feat2lvl': dd.feat2lvl}
+        self.fv_probs = dd.fv_probs
+        self.model = dd.content_hash()
+        self.specs = dict()     # array name -> (segment name, shape, dtype)
+        self._shms = []         # segments owned by the publisher (not pickled)
+        for name in self.ARRAYS:
+            arr = getattr(store, name)
+            shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+            self._shms.append(shm)
+            self.specs[name] = (shm.name, arr.shape, arr.dtype.str)
+
+    @property
+    def name(self):
+        # one handle per publication, identified by one of its segments
+        return self.specs['chd'][0]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_shms'] = []
+        return state
+
+    def attach(self):
+        """
+            Rebuild the OMDD (in compact mode) on top of the shared arrays.
+        """
+        shms = []
+        arrays = dict()
+        for name in self.ARRAYS:
+            shm_name, shape, dtype = self.specs[name]
+            shm = _attach_shm(shm_name)
+            shms.append(shm)
+            arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        dd = OMDD(None, store=CompactStore(**arrays), **self.meta)
+        dd.set_fv_probs(self.fv_probs)
+        dd._hash = self.model
+        # keep the segments open as long as the model lives
+        dd._shms = shms
+        return dd
+
+    def unlink(self):
+        """
+            Release the shared memory (publisher side).
+        """
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+        self._shms = []
+
+
+################################################################################
+# worker side: models are attached once per worker process
+_ATTACHED = dict()
+
+
+def attached(handle: SharedOMDD):
+    """
+        The OMDD of a handle in this process, with a reachability cache
+        shared by all the explanations computed by this process.
+
+        :return: the OMDD and its ReachCache.
+    """
+    if handle.name not in _ATTACHED:
+        from xpmdd import ReachCache
+        dd = handle.attach()
+        _ATTACHED[handle.name] = (dd, ReachCache(dd))
+    return _ATTACHED[handle.name]
+
+
+_SHAP = dict()
+
+
+def shap_explainer(handle: SharedOMDD):
+    """
+        The SHAPoMDD of a handle in this process, whose counting tables
+        (SHAPoMDD.precompute) are shared by all the instances handled by this process.
+    """
+    if handle.name not in _SHAP:
+        from SHAPmdd import SHAPoMDD
+        dd, _ = attached(handle)
+        _SHAP[handle.name] = SHAPoMDD(dd)
+    return _SHAP[handle.name]
+
+
+def _explain_one(handle, inst, xtype, enum):
+    from xpmdd import XpOMDD
+    dd, reach = attached(handle)
+    tar = dd.predict_one(inst)
+    xpmdd = XpOMDD(dd, inst, tar, oracle=reach.path_to_other_class)
+    if enum:
+        axps, cxps = xpmdd.enum()
+        return tar, axps, cxps
+    return (tar,
+            [xpmdd.find_axp()] if xtype != 'cxp' else None,
+            [xpmdd.find_cxp()] if xtype != 'axp' else None)
+
+
+def _shap_one(handle, inst, vtype):
+    return shap_explainer(handle).shap_scores(inst, vtype)
+
+
+def explain_parallel(dd: OMDD, X, xtype='axp', enum=False, workers=None, chunksize=16):
+    """
+        Same as XpOMDD.explain_batch, with the instances spread over worker processes
+        that share the model through shared memory.
+
+        :return: an XpBatch.
+    """
+    from xpmdd import XpBatch
+    assert xtype in ('axp', 'cxp', 'both')
+    insts = dd.as_matrix(X).tolist()
+    handle = SharedOMDD(dd)
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            res = list(pool.map(_explain_one, [handle] * len(insts), insts,
+                                [xtype] * len(insts), [enum] * len(insts), chunksize=chunksize))
+    finally:
+        handle.unlink()
+    return XpBatch([r[0] for r in res], [r[1] for r in res], [r[2] for r in res])
+
+
+def shap_parallel(dd: OMDD, X, vtype='expected', workers=None, chunksize=4):
+    """
+        SHAP scores (SHAPoMDD.shap_scores) of all features of many instances,
+        computed by worker processes sharing the model through shared memory.
+
+        :return: a list of lists of scores, one per instance.
+    """
+    insts = dd.as_matrix(X).tolist()
+    handle = SharedOMDD(dd)
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            return list(pool.map(_shap_one, [handle] * len(insts), insts, [vtype] * len(insts),
+                                 chunksize=chunksize))
+    finally:
+        handle.unlink()
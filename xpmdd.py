@@ -6,9 +6,19 @@
 import time
 from itertools import chain, combinations
 from omdd import OMDD
-from pysat.formula import IDPool
-from pysat.solvers import Solver as SAT_Solver
 ################################################################################
+# pysat is only needed for enumeration, it is imported on first use (fast startup)
+IDPool = None
+SAT_Solver = None
+ITotalizer = None
+
+
+def load_pysat():
+    global IDPool, SAT_Solver, ITotalizer
+    if SAT_Solver is None:
+        from pysat.formula import IDPool
+        from pysat.solvers import Solver as SAT_Solver
+        from pysat.card import ITotalizer
 
 
 def powerset_generator(input):
@@ -17,6 +27,17 @@ def powerset_generator(input):
         yield set(subset)
 
 
+def order_by_scores(scores):
+    """
+        Deletion order from feature importance priors (e.g. SHAP scores or FRP):
+        the least important features are tried first.
+
+        :param scores: a list of scores, one per feature.
+        :return: a list of feature indices.
+    """
+    return sorted(range(len(scores)), key=lambda i: abs(scores[i]))
+
+
 def checkMHS(in_axps: list, in_cxps: list):
     # given a list of axp and a list of cxp,
     # check if they are minimal-hitting-set (MHS) of each other
@@ -87,24 +108,169 @@ def checkMHS(in_axps: list, in_cxps: list):
     return True
 
 
+class ReachCache(object):
+    """
+        Memoized reachability oracle, shared by the explainers of many instances of one OMDD.
+        Whether a terminal inconsistent with the target value is reachable from a node
+        only depends on the values of the fixed features at its level and below,
+        so results are cached per (node, target, projection of the instance on these levels)
+        and reused across oracle calls, instances sharing a path suffix, and identical instances.
+    """
+
+    def __init__(self, dd: OMDD):
+        self.dd = dd
+        self.memo = dict()
+
+    def path_to_other_class(self, inst, tar, univ):
+        """
+            Same as OMDD.path_to_other_class, but memoized.
+
+            :param inst: given instance.
+            :param tar: target value of the given instance.
+            :param univ: a list of features declared as universal.
+            :return: true if there is a path to 0 else false.
+        """
+        # value of each level, None for universal features
+        masked = tuple(None if univ[f_id] else inst[f_id] for f_id in self.dd.lvl2fid)
+        return self._reach(self.dd.root, tar, masked)
+
+    def _reach(self, nd, tar, masked):
+        dd = self.dd
+        lvl = dd.nd2lvl[nd]
+        key = (nd, tar, masked[lvl:])
+        if key in self.memo:
+            return self.memo[key]
+        if nd in dd.nd2tar:
+            ret = dd.nd2tar[nd] != tar
+        elif masked[lvl] is None:
+            ret = any(self._reach(chd, tar, masked) for chd, vals in dd.children(nd))
+        else:
+            assert masked[lvl] in dd.nd2chd[nd], 'dead end branch'
+            ret = self._reach(dd.nd2chd[nd][masked[lvl]], tar, masked)
+        self.memo[key] = ret
+        return ret
+
+
+class XpBatch(object):
+    """
+        Columnar result of XpOMDD.explain_batch, one entry per input row.
+    """
+
+    def __init__(self, preds, axps, cxps):
+        self.preds = preds              # predictions
+        self.axps = axps                # list of AXps of each row (None if not computed)
+        self.cxps = cxps                # list of CXps of each row (None if not computed)
+
+    def __len__(self):
+        return len(self.preds)
+
+
 class XpOMDD(object):
 
-    def __init__(self, dd: OMDD, inst, tar, verb=0):
+    def __init__(self, dd: OMDD, inst, tar, verb=0, oracle=None):
         self.dd = dd                    # OMDD model
         self.inst = inst                # instance
         self.tar = tar                  # target value
         self.verbose = verb
+        # reachability oracle, e.g. a shared ReachCache
+        self.oracle = oracle if oracle else dd.path_to_other_class
+        # oracle calls and runtime of the last find_axp / find_cxp
+        self.stats = {'calls': 0, 'time': 0.0}
+
+    @classmethod
+    def explain_batch(cls, dd: OMDD, X, xtype='axp', enum=False, verb=0):
+        """
+            Explain many instances sharing one OMDD.
+            Identical instances are explained once, and reachability results
+            are shared between instances through a ReachCache.
+
+            :param dd: OMDD model.
+            :param X: a list (or 2-D array) of total instances, a DataFrame, an Arrow table
+                        or a Parquet file (see OMDD.as_columns).
+            :param xtype: 'axp', 'cxp' or 'both'.
+            :param enum: if true, enumerate all explanations
+                        (both AXps and CXps) instead of computing one.
+            :return: an XpBatch.
+        """
+
+        assert xtype in ('axp', 'cxp', 'both')
+        reach = ReachCache(dd)
+        done = dict()
+        preds, axps, cxps = [], [], []
+        # rows are checked and converted to Python ints in one vectorized step
+        for x in dd.as_matrix(X).tolist():
+            inst = tuple(x)
+            if inst not in done:
+                tar = dd.total_assignment(inst)
+                xpmdd = cls(dd, list(inst), tar, verb=verb, oracle=reach.path_to_other_class)
+                if enum:
+                    done[inst] = (tar,) + xpmdd.enum()
+                else:
+                    done[inst] = (tar,
+                                  [xpmdd.find_axp()] if xtype != 'cxp' else None,
+                                  [xpmdd.find_cxp()] if xtype != 'axp' else None)
+            tar, inst_axps, inst_cxps = done[inst]
+            preds.append(tar)
+            axps.append(inst_axps)
+            cxps.append(inst_cxps)
+        return XpBatch(preds, axps, cxps)
+
+    def deletion_order(self, order=None):
+        """
+            Order in which features are tried for deletion.
+
+            :param order: 'index' (default), 'level' (top level first),
+                        or a list of feature indices (e.g. from order_by_scores).
+            :return: a list of feature indices.
+        """
+
+        if order is None or order == 'index':
+            return list(range(self.dd.nf))
+        if order == 'level':
+            return list(self.dd.lvl2fid)
+        order = list(order)
+        assert sorted(order) == list(range(self.dd.nf)), 'not a permutation of the features'
+        return order
+
+    @staticmethod
+    def _quickxplain(cands, holds):
+        """
+            QuickXplain: a subset-minimal subset of cands satisfying a monotone predicate,
+            found by dropping blocks of candidates (divide and conquer);
+            about k log(n / k) predicate calls for a subset of size k.
+            The last candidates are the first to be dropped.
+
+            :param cands: a list of features.
+            :param holds: a monotone predicate over lists of features.
+            :return: a list of features.
+        """
+
+        def qx(base, has_delta, cs):
+            if has_delta and holds(base):
+                return []
+            if len(cs) <= 1:
+                return list(cs)
+            m = len(cs) // 2
+            d2 = qx(base + cs[:m], True, cs[m:])
+            d1 = qx(base + d2, bool(d2), cs[:m])
+            return d1 + d2
 
-    def find_axp(self, fixed=None):
+        return qx([], True, cands)
+
+    def find_axp(self, fixed=None, order=None, strategy='linear'):
         """
             Compute one abductive explanation (Axp).
 
             :param fixed: a list of features declared as fixed.
+            :param order: deletion order, see deletion_order.
+            :param strategy: 'linear' (one oracle call per feature)
+                        or 'quickxplain' (drop blocks of features).
             :return: one abductive explanation,
                         each element in the return Axp is a feature index.
         """
 
         time_solving_start = time.perf_counter()
+        assert strategy in ('linear', 'quickxplain')
 
         # get/create fix array
         if not fixed:
@@ -112,38 +278,59 @@ class XpOMDD(object):
         else:
             fix = fixed.copy()
         assert (len(fix) == self.dd.nf)
+        cands = [i for i in self.deletion_order(order) if fix[i]]
+        calls = 0
 
-        for i in range(self.dd.nf):
-            if fix[i]:
+        if strategy == 'linear':
+            for i in cands:
                 fix[i] = not fix[i]
-                if self.dd.path_to_other_class(self.inst, self.tar, [not v for v in fix]):
+                calls += 1
+                if self.oracle(self.inst, self.tar, [not v for v in fix]):
                     fix[i] = not fix[i]
+        else:
+            def weak_axp(feats):
+                nonlocal calls
+                calls += 1
+                univ = [True] * self.dd.nf
+                for i in feats:
+                    univ[i] = False
+                return not self.oracle(self.inst, self.tar, univ)
+
+            fix = [False] * self.dd.nf
+            for i in self._quickxplain(cands[::-1], weak_axp):
+                fix[i] = True
 
         axp = [i for i in range(self.dd.nf) if fix[i]]
         assert len(axp)
 
         time_solving_end = time.perf_counter()
         solving_time = time_solving_end - time_solving_start
+        self.stats = {'calls': calls, 'time': solving_time}
 
         if self.verbose:
             if self.verbose == 1:
                 print(f"Axp: {axp}")
             elif self.verbose == 2:
                 print(f"Axp: {axp} ({[self.dd.features[i] for i in axp]})")
+            print(f"Oracle calls: {calls}")
             print("Runtime: {0:.3f}".format(solving_time))
 
         return axp
 
-    def find_cxp(self, universal=None):
+    def find_cxp(self, universal=None, order=None, strategy='linear'):
         """
             Compute one contrastive explanation (Cxp).
 
             :param universal: a list of features declared as universal.
+            :param order: deletion order, see deletion_order.
+            :param strategy: 'linear' (one oracle call per feature)
+                        or 'quickxplain' (drop blocks of features).
             :return: one contrastive explanation,
                         each element in the return Cxp is a feature index.
         """
 
         time_solving_start = time.perf_counter()
+        assert strategy in ('linear', 'quickxplain')
 
         # get/create univ array
         if not universal:
@@ -151,36 +338,56 @@ class XpOMDD(object):
         else:
             univ = universal.copy()
         assert (len(univ) == self.dd.nf)
+        cands = [i for i in self.deletion_order(order) if univ[i]]
+        calls = 0
 
-        for i in range(self.dd.nf):
-            if univ[i]:
+        if strategy == 'linear':
+            for i in cands:
                 univ[i] = not univ[i]
-                if not self.dd.path_to_other_class(self.inst, self.tar, univ):
+                calls += 1
+                if not self.oracle(self.inst, self.tar, univ):
                     univ[i] = not univ[i]
+        else:
+            def weak_cxp(feats):
+                nonlocal calls
+                calls += 1
+                univ = [False] * self.dd.nf
+                for i in feats:
+                    univ[i] = True
+                return self.oracle(self.inst, self.tar, univ)
+
+            univ = [False] * self.dd.nf
+            for i in self._quickxplain(cands[::-1], weak_cxp):
+                univ[i] = True
 
         cxp = [i for i in range(self.dd.nf) if univ[i]]
         assert len(cxp)
 
         time_solving_end = time.perf_counter()
         solving_time = time_solving_end - time_solving_start
+        self.stats = {'calls': calls, 'time': solving_time}
 
         if self.verbose:
             if self.verbose == 1:
                 print(f"Cxp: {cxp}")
             elif self.verbose == 2:
                 print(f"Cxp: {cxp} ({[self.dd.features[i] for i in cxp]})")
+            print(f"Oracle calls: {calls}")
             print("Runtime: {0:.3f}".format(solving_time))
 
         return cxp
 
-    def enum(self):
+    def enum(self, order=None, strategy='linear'):
         """
             Enumerate all (abductive and contrastive) explanations, using MARCO algorithm.
 
+            :param order: deletion order used to shrink each explanation, see deletion_order.
+            :param strategy: deletion strategy used to shrink each explanation.
             :return: a list of all Axps, a list of all Cxps.
         """
 
         #########################################
+        load_pysat()
         vpool = IDPool()
 
         def new_var(name):
@@ -213,12 +420,12 @@ class XpOMDD(object):
                 for lit in model:
                     name = vpool.obj(abs(lit)).split(sep='_')
                     univ[int(name[1])] = False if lit < 0 else True
-                if self.dd.path_to_other_class(self.inst, self.tar, univ):
-                    cxp = self.find_cxp(univ)
+                if self.oracle(self.inst, self.tar, univ):
+                    cxp = self.find_cxp(univ, order, strategy)
                     slv.add_clause([-new_var(f'u_{i}') for i in cxp])
                     cxps.append(cxp)
                 else:
-                    axp = self.find_axp([not i for i in univ])
+                    axp = self.find_axp([not i for i in univ], order, strategy)
                     slv.add_clause([new_var(f'u_{i}') for i in axp])
                     axps.append(axp)
 
@@ -231,6 +438,130 @@ class XpOMDD(object):
 
         return axps, cxps
 
+    def _shortest_cxp(self, fixed=None):
+        """
+            Shortest path (in the number of features whose value is changed)
+            from the root to a terminal inconsistent with the target value,
+            without changing the fixed features.
+
+            :param fixed: a list of features declared as fixed.
+            :return: the changed features of a shortest path (a minimum weak Cxp),
+                        None if all such paths are blocked.
+        """
+
+        dd = self.dd
+        inf = dd.nf + 1
+        cost = dict()
+        best = dict()
+        for nd in dd.topo_order():
+            if nd in dd.nd2tar:
+                cost[nd] = 0 if dd.nd2tar[nd] != self.tar else inf
+                continue
+            f_id = dd.nd2fid[nd]
+            cost[nd] = inf
+            for chd, vals in dd.children(nd):
+                if self.inst[f_id] in vals:
+                    c = cost[chd]
+                elif fixed and fixed[f_id]:
+                    continue
+                else:
+                    c = cost[chd] + 1
+                if c < cost[nd]:
+                    cost[nd] = c
+                    best[nd] = (chd, vals)
+        if cost[dd.root] >= inf:
+            return None
+        cxp = []
+        nd = dd.root
+        while nd in best:
+            chd, vals = best[nd]
+            if self.inst[dd.nd2fid[nd]] not in vals:
+                cxp.append(dd.nd2fid[nd])
+            nd = chd
+        return sorted(cxp)
+
+    def find_min_cxp(self, k=None):
+        """
+            Compute one cardinality-minimal contrastive explanation (Cxp),
+            by a shortest path in the OMDD (linear in its size).
+
+            :param k: if given, only a Cxp of size at most k is returned.
+            :return: one smallest Cxp, None if its size exceeds k.
+        """
+
+        time_solving_start = time.perf_counter()
+        cxp = self._shortest_cxp()
+        assert cxp
+        if k is not None and len(cxp) > k:
+            cxp = None
+        solving_time = time.perf_counter() - time_solving_start
+
+        if self.verbose:
+            print(f"Smallest Cxp: {cxp}")
+            print("Runtime: {0:.3f}".format(solving_time))
+
+        return cxp
+
+    def find_min_axp(self, k=None, time_budget=None):
+        """
+            Compute one cardinality-minimal abductive explanation (Axp),
+            as a minimum hitting set of Cxps (implicit hitting set duality):
+            a SAT solver with a cardinality constraint (incremental totalizer)
+            proposes a smallest set of features hitting the Cxps found so far;
+            if fixing them blocks every path to another class, it is a smallest Axp,
+            otherwise a smallest Cxp avoiding them is added and the search resumes.
+
+            :param k: if given, return the first Axp of size at most k found
+                        (not necessarily the smallest), None if there is none.
+            :param time_budget: if given (in seconds), return the smallest Axp
+                        known when the budget is exhausted (possibly not cardinality-minimal).
+            :return: one Axp, each element is a feature index.
+        """
+
+        time_solving_start = time.perf_counter()
+        load_pysat()
+        nf = self.dd.nf
+        # feature i is fixed iff variable i + 1 is true
+        best = None
+        if time_budget is not None or k is not None:
+            best = self.find_axp()
+            if k is not None and len(best) > k:
+                best = None
+        axp = None
+        if best is None or k is None:
+            with SAT_Solver(name="glucose4") as slv, \
+                    ITotalizer(lits=list(range(1, nf + 1)), ubound=nf, top_id=nf) as tot:
+                slv.append_formula(tot.cnf.clauses)
+                bound = nf if k is None else min(k, nf)
+                size = 0 if k is None else bound
+                while size <= bound:
+                    if time_budget is not None and time.perf_counter() - time_solving_start > time_budget:
+                        break
+                    assumps = [-tot.rhs[size]] if size < nf else []
+                    if not slv.solve(assumptions=assumps):
+                        if k is not None:
+                            break
+                        # no hitting set of this size, the smallest Axp is larger
+                        size += 1
+                        continue
+                    model = slv.get_model()
+                    fixed = [model[i] > 0 for i in range(nf)]
+                    cxp = self._shortest_cxp(fixed)
+                    if cxp is None:
+                        # a weak Axp, which is subset-minimal if of minimum size
+                        axp = self.find_axp(fixed) if k is not None else [i for i in range(nf) if fixed[i]]
+                        break
+                    slv.add_clause([i + 1 for i in cxp])
+        if axp is None:
+            axp = best
+        solving_time = time.perf_counter() - time_solving_start
+
+        if self.verbose:
+            print(f"Smallest Axp: {axp}")
+            print("Runtime: {0:.3f}".format(solving_time))
+
+        return axp
+
     def check_one_axp(self, axp):
         """
             Check if given axp is 1) a weak AXp and 2) subset-minimal.
@@ -244,14 +575,14 @@ class XpOMDD(object):
         for i in axp:
             univ[i] = not univ[i]
         # 1) axp is a weak AXp if there are no path to 0.
-        if self.dd.path_to_other_class(self.inst, self.tar, univ):
+        if self.oracle(self.inst, self.tar, univ):
             print(f'given axp {axp} is not a weak AXp')
             return False
         # 2) axp is subset-minimal if axp \ {i} will activate a path to 0.
         for i in range(len(univ)):
             if not univ[i]:
                 univ[i] = not univ[i]
-                if self.dd.path_to_other_class(self.inst, self.tar, univ):
+                if self.oracle(self.inst, self.tar, univ):
                     univ[i] = not univ[i]
                 else:
                     print(f'given axp {axp} is not subset-minimal')
@@ -271,14 +602,14 @@ class XpOMDD(object):
         for i in cxp:
             univ[i] = True
         # 1) cxp is a weak CXp if there is a path to 0.
-        if not self.dd.path_to_other_class(self.inst, self.tar, univ):
+        if not self.oracle(self.inst, self.tar, univ):
             print(f'given cxp {cxp} is not a weak CXp')
             return False
         # 2) cxp is subset-minimal if cxp \ {i} will block all paths to 0.
         for i in range(self.dd.nf):
             if univ[i]:
                 univ[i] = not univ[i]
-                if not self.dd.path_to_other_class(self.inst, self.tar, univ):
+                if not self.oracle(self.inst, self.tar, univ):
                     univ[i] = not univ[i]
                 else:
                     print(f'given cxp {cxp} is not subset-minimal')